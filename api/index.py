@@ -0,0 +1,11 @@
+"""Vercel entry point - vercel.json rewrites every path to /api/index"""
+import os
+import sys
+
+# Serverless functions pay for everything built at import time on each cold start
+os.environ.setdefault('LAZY_INIT', '1')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat import create_app
+
+app = create_app()
@@ -1,23 +1,98 @@
-from flask import Flask, render_template_string, request, jsonify, Response, session, redirect, url_for
-import requests
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+from flask import Flask, request, jsonify, Response, session, redirect, url_for, g
+from flask.json.provider import DefaultJSONProvider
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.middleware.proxy_fix import ProxyFix
 import json
 import os
+import re
+import io
 from datetime import datetime
-import time
+from enum import Enum
 import secrets
 from urllib.parse import urlparse, parse_qs
 import uuid
 import hashlib
+import zlib
+import struct
+import copy
+import base64
+import atexit
 from functools import wraps
-import asyncio
+from collections import OrderedDict, deque
+import bisect
+import math
 import threading
 import logging
 from concurrent.futures import ThreadPoolExecutor
-import concurrent.futures
+
+try:
+    import orjson  # Optional: faster JSON encoding and decoding
+except ImportError:
+    orjson = None
+
+# Import-time profile (milliseconds), reported by /health
+IMPORT_PROFILE = {'imports_ms': round((time.perf_counter() - _IMPORT_STARTED) * 1000, 2)}
+
+# JSON codec: orjson when installed, else the standard library.
+# JSON_CODEC=stdlib forces the fallback.
+JSON_CODEC = 'orjson' if orjson is not None and os.environ.get('JSON_CODEC') != 'stdlib' else 'stdlib'
+
+if JSON_CODEC == 'orjson':
+    def json_bytes(obj):
+        """Compact UTF-8 JSON encoding of obj"""
+        return orjson.dumps(obj, default=DefaultJSONProvider.default, option=orjson.OPT_NON_STR_KEYS)
+    json_loads = orjson.loads
+else:
+    def json_bytes(obj):
+        """Compact UTF-8 JSON encoding of obj"""
+        return json.dumps(obj, default=DefaultJSONProvider.default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    json_loads = json.loads
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider (jsonify, request.json) backed by json_bytes/json_loads.
+    
+    Calls with encoder options (sort_keys, indent, ...) and pretty-printed
+    responses (debug mode, compact=False) go to the standard provider.
+    """
+    
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return json_bytes(obj).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return json_loads(s)
+    
+    def response(self, *args, **kwargs):
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        if args and kwargs:
+            raise TypeError("app.json.response() takes either args or kwargs, not both")
+        if len(args) == 1:
+            obj = args[0]
+        else:
+            obj = args or kwargs or None
+        return self._app.response_class(json_bytes(obj) + b"\n", mimetype=self.mimetype)
 
 app = Flask(__name__)
+if JSON_CODEC == 'orjson':
+    app.json = FastJSONProvider(app)
 app.secret_key = os.environ.get('SECRET_KEY', secrets.token_hex(32))
 
+# Number of reverse proxies in front of the app (Vercel's edge is one). Only
+# that many X-Forwarded-For hops are trusted for request.remote_addr; the rest
+# of the header is client-controlled.
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', '1' if os.environ.get('VERCEL') else '0'))
+if TRUSTED_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS)
+
 # Default bot settings
 BOT_SETTINGS = {
     'name': 'JhonWilson AI - Unrestricted',
@@ -63,28 +138,556 @@ AVAILABLE_MODELS = {
 
 DEFAULT_MODEL = "nanobanana"
 
+# Record types
+# Users, conversations and image tasks are __slots__ records instead of dicts:
+# no per-object __dict__, timestamps as epoch milliseconds (cheap integer
+# compares and sorts) and shared enum members for roles and statuses.
+# Dict-style access (record['credits'], record.get(...)) still works, and
+# to_dict() is the serialization adapter that renders ISO-8601 timestamps.
+def now_ms():
+    """Current time as epoch milliseconds"""
+    return time.time_ns() // 1_000_000
+
+def iso_from_ms(ms):
+    return datetime.fromtimestamp(ms / 1000).isoformat()
+
+def ms_from_iso(value, default=None):
+    """Epoch milliseconds of an ISO-8601 string, or default if it does not parse"""
+    try:
+        return int(datetime.fromisoformat(value).timestamp() * 1000)
+    except (TypeError, ValueError):
+        return default
+
+class Role(str, Enum):
+    __str__ = str.__str__
+    USER = 'user'
+    ASSISTANT = 'assistant'
+
+class TaskStatus(str, Enum):
+    __str__ = str.__str__
+    PROCESSING = 'processing'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+
+class Record:
+    """Base for slotted records; unset optional fields read as missing keys"""
+    __slots__ = ()
+    TIMESTAMPS = ()  # Epoch-millisecond fields, rendered as ISO-8601 by to_dict
+    
+    def __init__(self, **fields):
+        for name, value in fields.items():
+            setattr(self, name, value)
+    
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+    
+    def __setitem__(self, key, value):
+        try:
+            setattr(self, key, value)
+        except AttributeError:
+            raise KeyError(key) from None
+    
+    def __contains__(self, key):
+        return hasattr(self, key)
+    
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+    
+    def to_dict(self):
+        data = {}
+        for name in self.__slots__:
+            if not name.startswith('_') and hasattr(self, name):
+                value = getattr(self, name)
+                if name in self.TIMESTAMPS and value is not None:
+                    value = iso_from_ms(value)
+                elif isinstance(value, Enum):
+                    value = value.value
+                data[name] = value
+        return data
+
+class UserRecord(Record):
+    __slots__ = ('id', 'username', 'password', 'credits', 'is_premium', 'unrestricted',
+                 'created_at', 'last_active', 'conversations')
+    TIMESTAMPS = ('created_at', 'last_active')
+
+class ConversationRecord(Record):
+    """A conversation whose message log is zlib-compressed while it sits idle.
+    
+    Reading or assigning .log (or record['log']) inflates a cold log first, so
+    callers never see the packed form. See freeze_idle_conversations.
+    """
+    __slots__ = ('id', 'user_id', 'created_at', 'updated_at', 'title', '_log', '_packed', '_count', '_touched')
+    TIMESTAMPS = ('created_at', 'updated_at')
+    
+    @property
+    def log(self):
+        with _tier_lock:
+            if self._log is None:
+                self._log = unpack_log(self._packed)
+                bump_stat('cold_conversations', -1)
+                bump_stat('cold_bytes', -len(self._packed))
+                self._packed = None
+            self._touched = time.monotonic()
+            return self._log
+    
+    @log.setter
+    def log(self, entries):
+        with _tier_lock:
+            if getattr(self, '_packed', None) is not None:
+                bump_stat('cold_conversations', -1)
+                bump_stat('cold_bytes', -len(self._packed))
+            self._log = entries
+            self._packed = None
+            self._touched = time.monotonic()
+    
+    @property
+    def message_count(self):
+        """Number of messages, without inflating a cold log"""
+        return self._count if self._log is None else len(self._log)
+    
+    def freeze(self, idle_since):
+        """Compress the log if untouched since idle_since; returns True if it did"""
+        with _tier_lock:
+            if self._log is None or len(self._log) < 2 or self._touched > idle_since:
+                return False
+            packed = pack_log(self._log)
+            self._count = len(self._log)
+            self._packed = packed
+            self._log = None
+        bump_stat('cold_conversations')
+        bump_stat('cold_bytes', len(packed))
+        return True
+    
+    def peek_log(self):
+        """The log without changing its tier; a cold log is inflated into a copy"""
+        with _tier_lock:
+            if self._log is not None:
+                return self._log
+            packed = self._packed
+        if packed is None:
+            return []  # Dropped while a reader held on to it
+        return unpack_log(packed)
+    
+    def packed(self):
+        """(zlib blob, message count) of the log, without changing its tier"""
+        with _tier_lock:
+            if self._log is None:
+                return self._packed, self._count
+            entries = list(self._log)
+        return pack_log(entries), len(entries)
+    
+    def load_packed(self, packed, count):
+        """Adopt a blob from packed() as the log, cold unless it is tiny"""
+        if count < 2:
+            self.log = unpack_log(packed)
+            return
+        with _tier_lock:
+            self._log = None
+            self._packed = packed
+            self._count = count
+            self._touched = 0.0
+        bump_stat('cold_conversations')
+        bump_stat('cold_bytes', len(packed))
+    
+    def drop(self):
+        """Release a cold log's share of the tier counters (on delete/evict)"""
+        with _tier_lock:
+            if self._packed is not None:
+                bump_stat('cold_conversations', -1)
+                bump_stat('cold_bytes', -len(self._packed))
+                self._packed = None
+
+class ImageTask(Record):
+    __slots__ = ('user_id', 'username', 'prompt', 'model_id', 'image_count', 'status', 'start_time',
+                 'conversation_id', 'progress', 'token', 'unrestricted', 'api_task_id', 'queue_id',
+                 'image_url', 'error')
+    TIMESTAMPS = ('start_time',)
+
+# Conversation tiering: logs of conversations idle for CONVERSATION_COLD_SECONDS
+# are packed to zlib blobs by a periodic sweep and inflated on next access
+CONVERSATION_COLD_SECONDS = float(os.environ.get('CONVERSATION_COLD_SECONDS', 600))
+TIER_SWEEP_SECONDS = 60
+_tier_lock = threading.Lock()
+_next_tier_sweep = 0.0
+
+def pack_log(entries):
+    return zlib.compress(json_bytes([[role.value, content] for role, content in entries]), 6)
+
+def unpack_log(packed):
+    return [(Role(role), content) for role, content in json_loads(zlib.decompress(packed))]
+
+def freeze_idle_conversations():
+    """Compress every conversation log untouched for CONVERSATION_COLD_SECONDS"""
+    idle_since = time.monotonic() - CONVERSATION_COLD_SECONDS
+    frozen = 0
+    for conv in list(CONVERSATIONS.values()):
+        if conv.freeze(idle_since):
+            frozen += 1
+    if frozen:
+        logger.info(f"Compressed {frozen} idle conversations ({STATS['cold_conversations']} cold)")
+
+def conversation_tiers():
+    """Hot/cold split of resident conversations"""
+    cold = STATS['cold_conversations']
+    total = STATS['conversations']
+    return {
+        'hot': total - cold,
+        'cold': cold,
+        'cold_ratio': round(cold / total, 3) if total else 0.0,
+        'cold_bytes': STATS['cold_bytes']
+    }
+
+@app.after_request
+def schedule_tier_sweep(response):
+    """Run freeze_idle_conversations in the background at most every TIER_SWEEP_SECONDS"""
+    global _next_tier_sweep
+    now = time.monotonic()
+    if now >= _next_tier_sweep:
+        _next_tier_sweep = now + TIER_SWEEP_SECONDS
+        get_executor().submit(freeze_idle_conversations)
+    return response
+
 # User and conversation storage (in production, use a database)
-USERS = {}
-CONVERSATIONS = {}
+USERS = {}  # user_id -> UserRecord
+CONVERSATIONS = {}  # conv_id -> ConversationRecord, in creation order
 MAX_CONVERSATIONS = 5000
 
+# Aggregate counters, updated wherever the underlying data changes so that
+# /health, home() and !status never scan USERS
+STATS = {
+    'users': 0,
+    'premium_users': 0,
+    'conversations': 0,
+    'image_tasks': 0,
+    'active_image_tasks': 0,
+    'cold_conversations': 0,  # Conversations whose log is compressed
+    'cold_bytes': 0  # Total size of the compressed logs
+}
+_stats_lock = threading.Lock()
+
+def bump_stat(name, delta=1):
+    with _stats_lock:
+        STATS[name] += delta
+
 # Store user image generation preferences
 USER_IMAGE_MODELS = {}  # user_id -> model_id
 USER_IMAGE_COUNTS = {}  # user_id -> image_count (1-10)
 
-# Thread pool for async operations
-executor = ThreadPoolExecutor(max_workers=10)
+# Serverless cold start configuration
+# In lazy mode the thread pool, HTTP session and compiled template are built on
+# first use instead of at import time. Vercel sets VERCEL=1 for every function.
+LAZY_INIT = os.environ.get('LAZY_INIT', '1' if os.environ.get('VERCEL') else '0') == '1'
+COLD_START_BUDGET_MS = float(os.environ.get('COLD_START_BUDGET_MS', 500))
+COLD_START = {
+    'lazy_init': LAZY_INIT,
+    'budget_ms': COLD_START_BUDGET_MS,
+    'first_request_ms': None
+}
+
+# Admission control: per-user and per-IP request rates (token buckets) and
+# global concurrency caps per route class. Excess requests get a fast 429.
+CHAT_RATE_PER_MINUTE = float(os.environ.get('CHAT_RATE_PER_MINUTE', 20))
+CHAT_BURST = int(os.environ.get('CHAT_BURST', 5))
+IMAGE_RATE_PER_MINUTE = float(os.environ.get('IMAGE_RATE_PER_MINUTE', 4))
+IMAGE_BURST = int(os.environ.get('IMAGE_BURST', 2))
+RESUME_RATE_PER_MINUTE = float(os.environ.get('RESUME_RATE_PER_MINUTE', 30))  # Reconnects; they do no upstream work
+RESUME_BURST = int(os.environ.get('RESUME_BURST', 6))
+IMPORT_RATE_PER_MINUTE = float(os.environ.get('IMPORT_RATE_PER_MINUTE', 2))
+IMPORT_BURST = int(os.environ.get('IMPORT_BURST', 2))
+IP_RATE_MULTIPLIER = 3  # Several users can share one IP behind NAT
+MAX_CONCURRENT_CHAT_STREAMS = int(os.environ.get('MAX_CONCURRENT_CHAT_STREAMS', 32))
+MAX_CONCURRENT_IMAGE_JOBS = int(os.environ.get('MAX_CONCURRENT_IMAGE_JOBS', 8))
+MAX_CONCURRENT_RESUMES = int(os.environ.get('MAX_CONCURRENT_RESUMES', 64))
+MAX_CONCURRENT_IMPORTS = int(os.environ.get('MAX_CONCURRENT_IMPORTS', 2))
+PRIORITY_RESERVED_STREAMS = int(os.environ.get('PRIORITY_RESERVED_STREAMS', 8))  # Extra chat slots only premium and admin may use
+
+# Chat upstream timeouts and circuit breaker thresholds
+UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', 5))
+UPSTREAM_READ_TIMEOUT = float(os.environ.get('UPSTREAM_READ_TIMEOUT', 60))
+BREAKER_WINDOW = 20  # Most recent upstream calls considered
+BREAKER_MIN_CALLS = 5
+BREAKER_FAILURE_RATE = 0.5  # Errors and slow calls both count as failures
+BREAKER_SLOW_CALL_SECONDS = float(os.environ.get('BREAKER_SLOW_CALL_SECONDS', 30))
+BREAKER_OPEN_SECONDS = float(os.environ.get('BREAKER_OPEN_SECONDS', 30))
+BREAKER_HALF_OPEN_PROBES = 1
+
+# Upstream response cache (opt-in): exact-match replies keyed on a hash of the
+# canonical upstream payload, for the chat modes listed, e.g. UPSTREAM_CACHE_MODES=image,chat
+UPSTREAM_CACHE_MODES = frozenset(m.strip() for m in os.environ.get('UPSTREAM_CACHE_MODES', '').split(',') if m.strip())
+UPSTREAM_CACHE_ENTRIES = int(os.environ.get('UPSTREAM_CACHE_ENTRIES', 1000))
+UPSTREAM_CACHE_MAX_BYTES = int(os.environ.get('UPSTREAM_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+UPSTREAM_CACHE_TTL = float(os.environ.get('UPSTREAM_CACHE_TTL', 3600))
+# Concurrent identical upstream calls share one request (single-flight). On by
+# default: users who send the same payload at the same time get the same
+# sampled reply (the upstream samples at temperature 0.8) rather than each
+# their own. UPSTREAM_COALESCE=0 turns it off.
+UPSTREAM_COALESCE = os.environ.get('UPSTREAM_COALESCE', '1') == '1'
+
+# Upstream scheduler: at most UPSTREAM_CONCURRENCY chat calls run at once and
+# the rest wait in weighted fair queues by tier (see FairScheduler)
+UPSTREAM_CONCURRENCY = int(os.environ.get('UPSTREAM_CONCURRENCY', 16))
+UPSTREAM_QUEUE_LIMIT = int(os.environ.get('UPSTREAM_QUEUE_LIMIT', 64))
+SCHEDULER_WEIGHTS = {'admin': 8, 'premium': 4, 'free': 1}
+SCHEDULER_DEADLINES = {'admin': 60, 'premium': 30, 'free': 15}  # Seconds a call may wait for a slot
+
+# Server-sent events
+SSE_HEARTBEAT_SECONDS = float(os.environ.get('SSE_HEARTBEAT_SECONDS', 15))
+CHAT_STREAM_TTL = float(os.environ.get('CHAT_STREAM_TTL', 120))  # Seconds a finished reply stays resumable
+CHAT_STREAM_MAX_AGE = 600  # Drop buffers of streams that never finished
+CONTEXT_MESSAGES = 10  # Conversation messages sent upstream with each turn
+
+# Durable state: users, credits and conversations are journaled to DATA_DIR
+# and restored by create_app() (see Journal). Empty disables it; it is off on
+# Vercel, whose filesystem does not outlive an instance. A relative path is
+# taken from this file's directory. One process per DATA_DIR, enforced with a
+# lock file: serve with a single worker, e.g.
+#     gunicorn -w 1 --threads 16 'chat:create_app()'
+# A server that loads `app` itself (gunicorn chat:app, flask run) restores on
+# its first request instead; a second worker on the same DATA_DIR fails every
+# request with the lock error.
+DATA_DIR = os.environ.get('DATA_DIR', '' if os.environ.get('VERCEL') else 'data')
+if DATA_DIR:
+    DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), DATA_DIR)
+JOURNAL_COMMIT_MS = float(os.environ.get('JOURNAL_COMMIT_MS', 0))  # Extra wait for a batch to fill
+SNAPSHOT_EVERY = int(os.environ.get('SNAPSHOT_EVERY', 200000))  # Journal records between snapshots
+
+# Server-side sessions: the cookie carries only an opaque id and the data
+# stays in 'memory' (LRU, per process) or 'sqlite' (shared by the workers on a
+# host, and the default alongside DATA_DIR). Serverless instances share
+# neither, so on Vercel the default is Flask's signed cookie session
+# ('cookie'). Only logged-in users get a session.
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'cookie' if os.environ.get('VERCEL') else 'sqlite' if DATA_DIR else 'memory')
+SESSION_DB_PATH = os.environ.get('SESSION_DB_PATH', os.path.join(DATA_DIR, 'sessions.db') if DATA_DIR else 'sessions.db')
+SESSION_LIFETIME = int(os.environ.get('SESSION_LIFETIME', 30 * 24 * 3600))  # Seconds since last use
+MAX_MEMORY_SESSIONS = int(os.environ.get('MAX_MEMORY_SESSIONS', 50000))
+
+# Thread pool for async operations (see get_executor)
+executor = None
+_init_lock = threading.Lock()
+_http_session = None
+_html_template = None
 
 logger = logging.getLogger(__name__)
 
+# Lazily built heavy objects
+def get_executor():
+    """Return the shared thread pool, creating it on first use"""
+    global executor
+    if executor is None:
+        with _init_lock:
+            if executor is None:
+                # Runs the upstream side of every chat stream (see start_chat_stream):
+                # one thread per admitted stream, including the reserved priority
+                # slots, so queueing happens in upstream_scheduler rather than
+                # in the pool; plus one for housekeeping like the tier sweep
+                executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_CHAT_STREAMS + PRIORITY_RESERVED_STREAMS + 1)
+    return executor
+
+def get_http_session():
+    """Return the shared requests session (keep-alive pool), created on first use"""
+    global _http_session
+    if _http_session is None:
+        with _init_lock:
+            if _http_session is None:
+                import requests  # deferred: importing requests is a large part of cold start
+                _http_session = requests.Session()
+    return _http_session
+
+def get_html_template():
+    """Return the compiled HTML_TEMPLATE, compiling it once on first use"""
+    global _html_template
+    if _html_template is None:
+        with _init_lock:
+            if _html_template is None:
+                _html_template = app.jinja_env.from_string(HTML_TEMPLATE)
+    return _html_template
+
+def render_html(**context):
+    """Render HTML_TEMPLATE without recompiling it on every request"""
+    app.update_template_context(context)
+    return get_html_template().render(context)
+
+def warm_up():
+    """Build every lazily created object up front (non-lazy mode)"""
+    started = time.perf_counter()
+    get_executor()
+    get_http_session()
+    get_html_template()
+    load_clipfly_tokens()
+    IMPORT_PROFILE['warm_up_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+# Server-side sessions
+class ServerSession(CallbackDict, SessionMixin):
+    """Session dict that remembers whether it was changed during the request"""
+    
+    def __init__(self, initial=None, sid=None, expires=None):
+        def on_update(self):
+            self.modified = True
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.expires = expires
+        self.modified = False
+        self.opened_user_id = self.get('user_id')
+
+class MemorySessionStore:
+    """Process-local session store, evicting the least recently used"""
+    
+    def __init__(self, max_sessions=MAX_MEMORY_SESSIONS):
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # sid -> (data, expires)
+        self._lock = threading.Lock()
+    
+    def load(self, sid):
+        with self._lock:
+            entry = self._sessions.get(sid)
+            if entry is None:
+                return None
+            if entry[1] < time.time():
+                del self._sessions[sid]
+                return None
+            self._sessions.move_to_end(sid)
+            return dict(entry[0]), entry[1]
+    
+    def save(self, sid, data, expires):
+        with self._lock:
+            self._sessions[sid] = (dict(data), expires)
+            self._sessions.move_to_end(sid)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+    
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+class SQLiteSessionStore:
+    """Session store in a SQLite file, shared by every worker on the host"""
+    
+    PRUNE_EVERY = 1000  # Saves between sweeps of expired rows
+    
+    def __init__(self, path=SESSION_DB_PATH):
+        self.path = path
+        self._db = None
+        self._lock = threading.Lock()
+        self._saves = 0
+    
+    def _connect(self):
+        if self._db is None:
+            import sqlite3  # deferred like the other optional backends
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)")
+            self._db = db
+        return self._db
+    
+    def load(self, sid):
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT data, expires FROM sessions WHERE sid = ? AND expires >= ?", (sid, time.time())
+            ).fetchone()
+        if row is None:
+            return None
+        return json_loads(row[0]), row[1]
+    
+    def save(self, sid, data, expires):
+        payload = json_bytes(dict(data)).decode('utf-8')
+        with self._lock:
+            db = self._connect()
+            db.execute("INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)", (sid, payload, expires))
+            self._saves += 1
+            if self._saves % self.PRUNE_EVERY == 0:
+                db.execute("DELETE FROM sessions WHERE expires < ?", (time.time(),))
+    
+    def delete(self, sid):
+        with self._lock:
+            self._connect().execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+class ServerSessionInterface(SessionInterface):
+    """Keeps session data in a store; the cookie holds only a random session id.
+    
+    The cookie is only written when a session id is issued (new session, or a
+    fresh id when the logged-in user changes), so ordinary requests carry no
+    Set-Cookie and no signing work. Expiry slides forward once a session is
+    past half its lifetime.
+    """
+    
+    def __init__(self, store, lifetime=SESSION_LIFETIME):
+        self.store = store
+        self.lifetime = lifetime
+    
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            entry = self.store.load(sid)
+            if entry is not None:
+                return ServerSession(entry[0], sid=sid, expires=entry[1])
+        return ServerSession()
+    
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        
+        if not session:
+            if session.sid and session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        
+        now = time.time()
+        if session.sid and session.get('user_id') != session.opened_user_id:
+            self.store.delete(session.sid)
+            session.sid = None
+        is_new = session.sid is None
+        stale = session.expires is not None and session.expires - now < self.lifetime / 2
+        if not (is_new or session.modified or stale):
+            return
+        
+        if is_new:
+            session.sid = secrets.token_urlsafe(32)
+        self.store.save(session.sid, session, now + self.lifetime)
+        if is_new:
+            response.set_cookie(
+                name, session.sid,
+                domain=domain, path=path,
+                httponly=self.get_cookie_httponly(app),
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app)
+            )
+
+if SESSION_BACKEND == 'memory':
+    app.session_interface = ServerSessionInterface(MemorySessionStore())
+elif SESSION_BACKEND == 'sqlite':
+    app.session_interface = ServerSessionInterface(SQLiteSessionStore())
+
 # ClipFly token manager
+# Parsed token file, reused until the file's mtime or size changes
+_clipfly_token_cache = {'stamp': None, 'tokens': []}
+
 def load_clipfly_tokens():
     """Load ClipFly tokens from file"""
+    return list(cached_clipfly_tokens())
+
+def clipfly_token_count():
+    """Number of ClipFly tokens, reading the file if it is unread or has changed"""
+    return len(cached_clipfly_tokens())
+
+def cached_clipfly_tokens():
+    """The token list, re-read only when the file's mtime or size changes. Do not mutate."""
     try:
         if not os.path.exists(CLIPFLY_TOKEN_FILE):
             logger.warning(f"{CLIPFLY_TOKEN_FILE} not found!")
             return []
         
+        stat = os.stat(CLIPFLY_TOKEN_FILE)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp == _clipfly_token_cache['stamp']:
+            return _clipfly_token_cache['tokens']
+        
         with open(CLIPFLY_TOKEN_FILE, "r") as f:
             tokens = []
             for line in f:
@@ -95,20 +698,29 @@ def load_clipfly_tokens():
                         tokens.append(token)
             
             print(f"Loaded {len(tokens)} ClipFly tokens from {CLIPFLY_TOKEN_FILE}")
+            _clipfly_token_cache['stamp'] = stamp
+            _clipfly_token_cache['tokens'] = tokens
             return tokens
     except Exception as e:
         print(f"Error loading ClipFly tokens: {e}")
         return []
 
+def save_clipfly_tokens(tokens):
+    """Write the token file and refresh the parsed cache"""
+    with open(CLIPFLY_TOKEN_FILE, "w") as f:
+        for t in tokens:
+            f.write(f"{t}\n")
+    stat = os.stat(CLIPFLY_TOKEN_FILE)
+    _clipfly_token_cache['stamp'] = (stat.st_mtime_ns, stat.st_size)
+    _clipfly_token_cache['tokens'] = list(tokens)
+
 def remove_clipfly_token(token: str):
     """Remove exhausted token"""
     try:
         tokens = load_clipfly_tokens()
         if token in tokens:
             tokens.remove(token)
-            with open(CLIPFLY_TOKEN_FILE, "w") as f:
-                for t in tokens:
-                    f.write(f"{t}\n")
+            save_clipfly_tokens(tokens)
             print(f"Removed exhausted token. Remaining: {len(tokens)}")
             return True
         return False
@@ -132,7 +744,7 @@ def download_image(url: str, filename: str):
             "Referer": "https://www.clipfly.ai/",
         }
         
-        response = requests.get(url, headers=headers, timeout=60)
+        response = get_http_session().get(url, headers=headers, timeout=60)
         if response.status_code == 200:
             with open(filepath, 'wb') as f:
                 f.write(response.content)
@@ -192,7 +804,7 @@ def generate_image_with_token(token: str, prompt: str, model_id: str = "nanobana
         print(f"Model: {model_id}")
         print(f"Image Count: {gnum}")
         
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
+        response = get_http_session().post(url, headers=headers, json=payload, timeout=30)
         print(f"Response status: {response.status_code}")
         
         if not response.text:
@@ -299,7 +911,7 @@ def get_queue_list(token: str, queue_id: int = None):
     }
     
     try:
-        response = requests.get(url, headers=headers, params=params, timeout=30)
+        response = get_http_session().get(url, headers=headers, params=params, timeout=30)
         data = response.json()
         return {
             "success": response.status_code == 200 and data.get("code") == 0,
@@ -424,38 +1036,456 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def user_tier(user_id):
+    """'admin', 'premium' or 'free': a user's role and scheduling tier"""
+    if user_id == ADMIN_USER_ID:
+        return 'admin'
+    return 'premium' if USERS.get(user_id, {}).get('is_premium') else 'free'
+
+def get_client_ip(request):
+    """Client IP as seen by the nearest trusted proxy (see TRUSTED_PROXY_HOPS)"""
+    return request.remote_addr
+
+class TokenBucket:
+    """Token bucket rate limiter keyed by user id or IP"""
+    
+    def __init__(self, rate_per_minute, burst, max_keys=10000):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()  # key -> [tokens, updated_at]
+        self.lock = threading.Lock()
+    
+    def take(self, key):
+        """Take one token; return 0 if allowed, else seconds until one is available"""
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = [self.burst, now]
+                if len(self.buckets) > self.max_keys:
+                    self.buckets.popitem(last=False)  # Least recently seen key starts full again
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+                self.buckets.move_to_end(key)
+            
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0
+            return (1 - bucket[0]) / self.rate
+
+ADMISSION_LIMITS = {
+    'chat': {
+        'user': TokenBucket(CHAT_RATE_PER_MINUTE, CHAT_BURST),
+        'ip': TokenBucket(CHAT_RATE_PER_MINUTE * IP_RATE_MULTIPLIER, CHAT_BURST * IP_RATE_MULTIPLIER),
+        'slots': threading.BoundedSemaphore(MAX_CONCURRENT_CHAT_STREAMS),
+        'reserved': threading.BoundedSemaphore(PRIORITY_RESERVED_STREAMS)  # Premium/admin overflow
+    },
+    'image': {
+        'user': TokenBucket(IMAGE_RATE_PER_MINUTE, IMAGE_BURST),
+        'ip': TokenBucket(IMAGE_RATE_PER_MINUTE * IP_RATE_MULTIPLIER, IMAGE_BURST * IP_RATE_MULTIPLIER),
+        'slots': threading.BoundedSemaphore(MAX_CONCURRENT_IMAGE_JOBS)
+    },
+    'resume': {
+        'user': TokenBucket(RESUME_RATE_PER_MINUTE, RESUME_BURST),
+        'ip': TokenBucket(RESUME_RATE_PER_MINUTE * IP_RATE_MULTIPLIER, RESUME_BURST * IP_RATE_MULTIPLIER),
+        'slots': threading.BoundedSemaphore(MAX_CONCURRENT_RESUMES)
+    },
+    'import': {
+        'user': TokenBucket(IMPORT_RATE_PER_MINUTE, IMPORT_BURST),
+        'ip': TokenBucket(IMPORT_RATE_PER_MINUTE * IP_RATE_MULTIPLIER, IMPORT_BURST * IP_RATE_MULTIPLIER),
+        'slots': threading.BoundedSemaphore(MAX_CONCURRENT_IMPORTS)
+    }
+}
+
+def too_many_requests(retry_after):
+    """Fast 429 with a Retry-After hint in whole seconds"""
+    retry_after = max(1, math.ceil(retry_after))
+    response = jsonify({
+        "success": False,
+        "error": f"Too many requests. Please retry in {retry_after}s",
+        "retry_after": retry_after
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def admission_control(route_class):
+    """Decorator to rate limit a route and cap its concurrency.
+    
+    The concurrency slot is released when the response is done: on return for
+    plain responses, on close for streamed ones. A view that starts background
+    work can keep the slot with hand_off_admission_slot().
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            limits = ADMISSION_LIMITS[route_class]
+            retry_after = limits['ip'].take(get_client_ip(request))
+            if not retry_after:
+                retry_after = limits['user'].take(session.get('user_id', ''))
+            if retry_after:
+                return too_many_requests(retry_after)
+            
+            slots = limits['slots']
+            if not slots.acquire(blocking=False):
+                # A flood of free requests must not lock paying users out
+                reserved = limits.get('reserved')
+                if reserved is None or user_tier(session.get('user_id')) == 'free' or not reserved.acquire(blocking=False):
+                    return too_many_requests(1)
+                slots = reserved
+            g.admission_slot = slots
+            try:
+                response = app.make_response(f(*args, **kwargs))
+            except Exception:
+                if g.pop('admission_slot', None):
+                    slots.release()
+                raise
+            
+            if g.pop('admission_slot', None):
+                if response.is_streamed:
+                    response.call_on_close(slots.release)
+                else:
+                    slots.release()
+            return response
+        return decorated_function
+    return decorator
+
+def hand_off_admission_slot():
+    """Take over the current request's concurrency slot; returns its release function"""
+    return g.pop('admission_slot').release
+
+def register_conversation(conv):
+    """Add a ConversationRecord and link it to its user"""
+    CONVERSATIONS[conv.id] = conv
+    bump_stat('conversations')
+    index = SEARCH_INDEXES.get(conv.user_id)
+    if index is not None:
+        index.add_conversation(conv)
+    mark_search_changed(conv.user_id, conv.id)
+    if conv.user_id in USERS:
+        if 'conversations' not in USERS[conv.user_id]:
+            USERS[conv.user_id]['conversations'] = []
+        USERS[conv.user_id]['conversations'].append(conv.id)
+
+def forget_conversation(conv_id):
+    """Remove a conversation and unlink it from its user"""
+    conv = CONVERSATIONS.pop(conv_id, None)
+    if conv is None:
+        return
+    conv.drop()
+    bump_stat('conversations', -1)
+    index = SEARCH_INDEXES.get(conv.user_id)
+    if index is not None:
+        index.remove_conversation(conv_id)
+    mark_search_changed(conv.user_id, conv_id)
+    user = USERS.get(conv.user_id)
+    if user is not None and conv_id in user['conversations']:
+        user['conversations'].remove(conv_id)
+
 def create_new_conversation(user_id):
     """Create a new conversation for a user"""
     conv_id = generate_conversation_id()
-    CONVERSATIONS[conv_id] = {
-        'id': conv_id,
-        'user_id': user_id,
-        'created_at': datetime.now().isoformat(),
-        'updated_at': datetime.now().isoformat(),
-        'title': 'New Chat',
-        'messages': [],
-        'history': []
-    }
-    
-    # Link conversation to user
-    if user_id in USERS:
-        if 'conversations' not in USERS[user_id]:
-            USERS[user_id]['conversations'] = []
-        USERS[user_id]['conversations'].append(conv_id)
-    
-    # Limit total conversations
-    if len(CONVERSATIONS) > MAX_CONVERSATIONS:
-        oldest = min(CONVERSATIONS.keys(), key=lambda k: CONVERSATIONS[k]['created_at'])
-        del CONVERSATIONS[oldest]
+    now = now_ms()
+    with _mutation_lock:
+        register_conversation(ConversationRecord(
+            id=conv_id,
+            user_id=user_id,
+            created_at=now,
+            updated_at=now,
+            title='New Chat',
+            log=[]  # (Role, content) turns; see conversation_messages/conversation_history
+        ))
+        journal('conv', conv_id, user_id, now)
+        enforce_conversation_limit()
     
     return conv_id
 
+def enforce_conversation_limit():
+    """Evict the oldest conversations beyond MAX_CONVERSATIONS. Caller holds _mutation_lock."""
+    # Insertion order is creation order, so the first key is the oldest
+    while len(CONVERSATIONS) > MAX_CONVERSATIONS:
+        oldest = next(iter(CONVERSATIONS))
+        forget_conversation(oldest)
+        journal('conv_del', oldest)
+
+# Each conversation keeps one message log of (role, content) tuples using the
+# upstream role names. The display list ('bot' for replies) and the upstream
+# history are views built from it, so each message body is stored once.
+DISPLAY_ROLES = {Role.USER: 'user', Role.ASSISTANT: 'bot'}
+LOG_ROLES = {'user': Role.USER, 'bot': Role.ASSISTANT, 'assistant': Role.ASSISTANT}
+
+def conversation_messages(conv, start=0, end=None):
+    """Messages [start:end] with display role names, as the UI renders them"""
+    return [{'role': DISPLAY_ROLES[role], 'content': content} for role, content in conv['log'][start:end]]
+
+def conversation_history(conv, limit=None):
+    """The last `limit` messages with upstream role names"""
+    entries = conv['log'][-limit:] if limit else conv['log']
+    return [{'role': role.value, 'content': content} for role, content in entries]
+
+def conversation_view(conv):
+    """A conversation as the API returns it"""
+    view = conv.to_dict()
+    view['messages'] = conversation_messages(conv)
+    return view
+
+def log_from_messages(messages):
+    """Rebuild a log from display or upstream style message dicts"""
+    return [
+        (LOG_ROLES[m['role']], str(m.get('content', '')))
+        for m in messages
+        if isinstance(m, dict) and m.get('role') in LOG_ROLES
+    ]
+
+def append_turn(conv_id, user_message, reply):
+    """Record one user message and its reply"""
+    conv = CONVERSATIONS.get(conv_id)
+    if conv is None:
+        return
+    with _mutation_lock:
+        log = conv['log']
+        position = len(log)
+        log.extend(((Role.USER, user_message), (Role.ASSISTANT, reply)))
+        conv['updated_at'] = now_ms()
+        journal('turn', conv_id, position, user_message, reply, conv['updated_at'])
+        index = SEARCH_INDEXES.get(conv.user_id)
+        if index is not None:
+            index.add_messages(conv_id, position, (user_message, reply))
+        mark_search_changed(conv.user_id, conv_id)
+
+def replace_log(conv, entries):
+    """Replace a conversation's whole log (edit, import or clear)"""
+    with _mutation_lock:
+        conv['log'] = entries
+        conv['updated_at'] = now_ms()
+        journal('log', conv.id, [[role.value, content] for role, content in entries], conv['updated_at'])
+        index = SEARCH_INDEXES.get(conv.user_id)
+        if index is not None:
+            index.remove_conversation(conv.id)
+            index.add_conversation(conv)
+        mark_search_changed(conv.user_id, conv.id)
+
+def set_conversation_title(conv, title):
+    with _mutation_lock:
+        conv['title'] = title
+        conv['updated_at'] = now_ms()
+        journal('title', conv.id, title, conv['updated_at'])
+        index = SEARCH_INDEXES.get(conv.user_id)
+        if index is not None:
+            index.set_title(conv.id, title)
+        mark_search_changed(conv.user_id, conv.id)
+
 def update_conversation_title(conv_id, first_message):
     """Auto-generate conversation title from first message"""
     if conv_id in CONVERSATIONS:
         title = first_message[:50] + ('...' if len(first_message) > 50 else '')
-        CONVERSATIONS[conv_id]['title'] = title
-        CONVERSATIONS[conv_id]['updated_at'] = datetime.now().isoformat()
+        set_conversation_title(CONVERSATIONS[conv_id], title)
+
+# Conversation search
+# Each user gets an inverted index over their conversation titles and
+# messages. It is built on the user's first search (reading cold logs without
+# warming them) and then kept current by the conversation mutators above, so
+# a search only touches postings; message bodies are read just for the
+# snippets of the returned page. Indexes of users who have not searched
+# recently are dropped (LRU) and rebuilt on demand. Builds run outside
+# _mutation_lock and catch up on the conversations changed meanwhile.
+MAX_SEARCH_INDEXES = int(os.environ.get('MAX_SEARCH_INDEXES', 1000))
+SEARCH_RESULTS = 20
+SEARCH_TITLE_BOOST = 2.0  # A title match counts like a term used throughout the conversation
+SEARCH_SNIPPET_CHARS = 160
+SEARCH_CATCH_UP_BATCH = 8  # Conversations re-indexed per _mutation_lock hold after a build
+SEARCH_INDEXES = OrderedDict()  # user_id -> SearchIndex, least recently searched first
+SEARCH_BUILDS = {}  # user_id -> [conv_ids changed since each build in progress began]
+_search_term_re = re.compile(r'\w{2,40}')
+
+def search_terms(text):
+    """Lowercased word tokens of text, as indexed and searched"""
+    return _search_term_re.findall(text.lower())
+
+class SearchIndex:
+    """Inverted index over one user's conversations. Callers hold _mutation_lock once it is in SEARCH_INDEXES."""
+    
+    def __init__(self):
+        self.body = {}  # term -> {conv_id: [occurrences, position of the latest message using it]}
+        self.titles = {}  # term -> set of conv_ids
+        self.conv_terms = {}  # conv_id -> (body terms, title terms), for removal
+    
+    def add_conversation(self, conv):
+        self.conv_terms[conv.id] = (set(), set())
+        self.set_title(conv.id, conv.title)
+        self.add_messages(conv.id, 0, [content for _, content in conv.peek_log()])
+    
+    def remove_conversation(self, conv_id):
+        body_terms, title_terms = self.conv_terms.pop(conv_id, ((), ()))
+        for term in body_terms:
+            postings = self.body[term]
+            del postings[conv_id]
+            if not postings:
+                del self.body[term]
+        for term in title_terms:
+            self._unlink_title(term, conv_id)
+    
+    def _unlink_title(self, term, conv_id):
+        convs = self.titles[term]
+        convs.discard(conv_id)
+        if not convs:
+            del self.titles[term]
+    
+    def set_title(self, conv_id, title):
+        entry = self.conv_terms.get(conv_id)
+        if entry is None:
+            return  # Not indexed (e.g. it never reached its user's list)
+        title_terms = entry[1]
+        for term in title_terms:
+            self._unlink_title(term, conv_id)
+        title_terms.clear()
+        for term in search_terms(title):
+            self.titles.setdefault(term, set()).add(conv_id)
+            title_terms.add(term)
+    
+    def add_messages(self, conv_id, position, texts):
+        """Index messages starting at log position `position`"""
+        entry = self.conv_terms.get(conv_id)
+        if entry is None:
+            return
+        body_terms = entry[0]
+        for offset, text in enumerate(texts):
+            for term in search_terms(text):
+                postings = self.body.setdefault(term, {})
+                entry = postings.get(conv_id)
+                if entry is None:
+                    postings[conv_id] = [1, position + offset]
+                    body_terms.add(term)
+                else:
+                    entry[0] += 1
+                    entry[1] = position + offset
+    
+    def matching(self, term):
+        return self.body.get(term, {}).keys() | self.titles.get(term, set())
+    
+    def search(self, terms):
+        """(score, conv_id, snippet position) of conversations containing every term, best first.
+        
+        Scoring is BM25-like: per term, inverse document frequency times a
+        saturating occurrence count, plus SEARCH_TITLE_BOOST for a title match.
+        The snippet position is the latest message using a term (None if
+        only the title matched).
+        """
+        matches = None
+        doc_freq = {}
+        for term in terms:
+            convs = self.matching(term)
+            doc_freq[term] = len(convs)
+            matches = convs if matches is None else matches & convs
+            if not matches:
+                return []
+        total = len(self.conv_terms)
+        idf = {term: math.log(1 + (total - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+        results = []
+        for conv_id in matches:
+            score = 0.0
+            position = None
+            for term in terms:
+                entry = self.body.get(term, {}).get(conv_id)
+                weight = SEARCH_TITLE_BOOST if conv_id in self.titles.get(term, ()) else 0.0
+                if entry is not None:
+                    weight += entry[0] / (entry[0] + 1.2)
+                    if position is None or entry[1] > position:
+                        position = entry[1]
+                score += idf[term] * weight
+            results.append((score, conv_id, position))
+        results.sort(key=lambda result: result[0], reverse=True)
+        return results
+
+def mark_search_changed(user_id, conv_id):
+    """Note a conversation change for the user's index builds in progress. Caller holds _mutation_lock."""
+    for changed in SEARCH_BUILDS.get(user_id, ()):
+        changed.add(conv_id)
+
+def search_index(user_id):
+    """The user's SearchIndex, built on first use.
+    
+    Building inflates every cold conversation, so it works from a snapshot
+    of the user's conversation ids without _mutation_lock, then re-indexes
+    under the lock the conversations that changed while it ran.
+    """
+    with _mutation_lock:
+        index = SEARCH_INDEXES.get(user_id)
+        if index is not None:
+            SEARCH_INDEXES.move_to_end(user_id)
+            return index
+        conv_ids = list(USERS.get(user_id, {}).get('conversations', []))
+        changed = set()
+        SEARCH_BUILDS.setdefault(user_id, []).append(changed)
+    
+    def stop_tracking():
+        builds = SEARCH_BUILDS[user_id]
+        builds.remove(changed)
+        if not builds:
+            del SEARCH_BUILDS[user_id]
+    
+    index = SearchIndex()
+    try:
+        for conv_id in conv_ids:
+            conv = CONVERSATIONS.get(conv_id)
+            if conv is not None:
+                index.add_conversation(conv)
+    except BaseException:
+        with _mutation_lock:
+            stop_tracking()
+        raise
+    
+    # Catch up a few conversations per lock hold, so writers only wait briefly
+    while True:
+        with _mutation_lock:
+            for _ in range(min(len(changed), SEARCH_CATCH_UP_BATCH)):
+                conv_id = changed.pop()
+                index.remove_conversation(conv_id)
+                conv = CONVERSATIONS.get(conv_id)
+                if conv is not None and conv.user_id == user_id:
+                    index.add_conversation(conv)
+            if not changed:
+                stop_tracking()
+                SEARCH_INDEXES[user_id] = index
+                if len(SEARCH_INDEXES) > MAX_SEARCH_INDEXES:
+                    SEARCH_INDEXES.popitem(last=False)
+                return index
+
+def search_snippet(conv, position, terms):
+    """Text around the first query term in message `position`"""
+    if position is None:
+        return None
+    log = conv.peek_log()
+    if position >= len(log):
+        return None
+    role, content = log[position]
+    lowered = content.lower()
+    hits = [at for at in (lowered.find(term) for term in terms) if at >= 0]
+    start = max(0, min(hits, default=0) - SEARCH_SNIPPET_CHARS // 3)
+    end = start + SEARCH_SNIPPET_CHARS
+    text = ('…' if start else '') + content[start:end].strip() + ('…' if end < len(content) else '')
+    return {'position': position, 'role': DISPLAY_ROLES[role], 'text': text}
+
+def search_conversations(user_id, query, limit=SEARCH_RESULTS):
+    """Ranked conversations of a user matching every word of query, with snippets"""
+    terms = list(dict.fromkeys(search_terms(query)))
+    if not terms:
+        return {'results': [], 'total': 0, 'terms': []}
+    index = search_index(user_id)
+    with _mutation_lock:
+        ranked = index.search(terms)
+    results = []
+    for score, conv_id, position in ranked[:limit]:
+        conv = CONVERSATIONS.get(conv_id)
+        if conv is None:
+            continue
+        item = conversation_summary(conv)
+        item['score'] = round(score, 3)
+        item['snippet'] = search_snippet(conv, position, terms)
+        results.append(item)
+    return {'results': results, 'total': len(ranked), 'terms': terms}
 
 def user_has_credits(user_id):
     """Check if user has credits"""
@@ -469,6 +1499,18 @@ def user_has_credits(user_id):
         return USERS[user_id]['credits'] > 0
     return False
 
+# Credit ledger. Every change to a user's credits or tier goes through
+# the functions below, which bump the user's credit version; the version
+# is the ETag of the credit view, so unchanged polls cost a 304.
+CREDIT_VERSIONS = {}  # user_id -> int
+CREDIT_EPOCH = uuid.uuid4().hex[:8]  # Keeps ETags from a previous process from matching
+
+def bump_credit_version(user_id):
+    CREDIT_VERSIONS[user_id] = CREDIT_VERSIONS.get(user_id, 0) + 1
+
+def credit_etag(user_id):
+    return f'"{CREDIT_EPOCH}-{user_id}-{CREDIT_VERSIONS.get(user_id, 0)}"'
+
 def use_credit(user_id):
     """Use one credit from user"""
     if user_id == ADMIN_USER_ID and ADMIN_UNLIMITED:
@@ -477,35 +1519,570 @@ def use_credit(user_id):
     if user_id in USERS and USERS[user_id].get('unrestricted', False):
         return True  # Premium users don't use credits
     
-    if user_id in USERS and USERS[user_id]['credits'] > 0:
-        USERS[user_id]['credits'] -= 1
-        return True
+    if user_id in USERS:
+        with _mutation_lock:
+            if USERS[user_id]['credits'] > 0:
+                USERS[user_id]['credits'] -= 1
+                bump_credit_version(user_id)
+                journal('credits', user_id, USERS[user_id]['credits'])
+                return True
     return False
 
 def add_credits(user_id, amount):
     """Add credits to user"""
     if user_id in USERS:
-        USERS[user_id]['credits'] += amount
+        with _mutation_lock:
+            USERS[user_id]['credits'] += amount
+            bump_credit_version(user_id)
+            committed = journal('credits', user_id, USERS[user_id]['credits'])
+        wait_durable(committed)
         return True
     return False
 
+def apply_premium(user_id, is_premium, credits):
+    user = USERS[user_id]
+    if user.get('is_premium', False) != is_premium:
+        bump_stat('premium_users', 1 if is_premium else -1)
+    user['is_premium'] = is_premium
+    user['unrestricted'] = is_premium
+    user['credits'] = credits
+    USER_INDEX.set_premium(user_id, is_premium)
+
+def set_premium(user_id, is_premium):
+    """Grant or revoke premium; granting resets credits to PREMIUM_CREDITS"""
+    with _mutation_lock:
+        credits = PREMIUM_CREDITS if is_premium else USERS[user_id]['credits']
+        apply_premium(user_id, is_premium, credits)
+        bump_credit_version(user_id)
+        committed = journal('premium', user_id, is_premium, credits)
+    wait_durable(committed)
+
+# Admin user listing
+LOW_CREDITS_THRESHOLD = 10
+INACTIVE_DAYS = 30
+ADMIN_USERS_PAGE_SIZE = 50
+MAX_ADMIN_USERS_PAGE_SIZE = 500
+
+class UserIndex:
+    """Orderings over USERS maintained on insert, so listings never sort the table"""
+    
+    def __init__(self):
+        self.created = []    # user ids, oldest first
+        self.rank = {}       # user_id -> position in created
+        self.usernames = []  # (lowercase username, user_id), sorted
+        self.premium = []    # ranks of premium users, sorted
+        self._lock = threading.Lock()
+    
+    def add(self, user_id, username, is_premium=False):
+        with self._lock:
+            self.rank[user_id] = len(self.created)
+            self.created.append(user_id)
+            bisect.insort(self.usernames, (username.lower(), user_id))
+            if is_premium:
+                bisect.insort(self.premium, self.rank[user_id])
+    
+    def set_premium(self, user_id, is_premium):
+        with self._lock:
+            rank = self.rank[user_id]
+            i = bisect.bisect_left(self.premium, rank)
+            present = i < len(self.premium) and self.premium[i] == rank
+            if is_premium and not present:
+                self.premium.insert(i, rank)
+            elif not is_premium and present:
+                del self.premium[i]
+    
+    def newest_first(self, after=None):
+        """User ids by creation, newest first, starting below the cursor user"""
+        i = self.rank[after] - 1 if after in self.rank else len(self.created) - 1
+        while i >= 0:
+            yield self.created[i]
+            i -= 1
+    
+    def premium_newest_first(self, after=None):
+        """Premium user ids by creation, newest first, starting below the cursor user"""
+        below = self.rank[after] if after in self.rank else len(self.created)
+        while True:
+            # Re-bisect each step so grants and revocations mid-listing are safe
+            i = bisect.bisect_left(self.premium, below) - 1
+            if i < 0:
+                return
+            below = self.premium[i]
+            yield self.created[below]
+    
+    def by_username(self, prefix, after=None):
+        """User ids whose username starts with prefix, alphabetically"""
+        prefix = prefix.lower()
+        if after in USERS:
+            i = bisect.bisect_right(self.usernames, (USERS[after]['username'].lower(), after))
+        else:
+            i = bisect.bisect_left(self.usernames, (prefix,))
+        while i < len(self.usernames) and self.usernames[i][0].startswith(prefix):
+            yield self.usernames[i][1]
+            i += 1
+
+USER_INDEX = UserIndex()
+
+def admin_user_row(user):
+    return {
+        'id': user['id'],
+        'username': user['username'],
+        'credits': user['credits'],
+        'is_premium': user.get('is_premium', False),
+        'created_at': iso_from_ms(user['created_at']),
+        'last_active': iso_from_ms(user.get('last_active', user['created_at'])),
+        'conversation_count': len(user.get('conversations', []))
+    }
+
+def query_users(search='', premium=False, low_credits=False, inactive=False, after=None, limit=ADMIN_USERS_PAGE_SIZE):
+    """One page of non-admin users matching the filters.
+    
+    Pages are cursor based: pass the returned next_cursor as after. Listings
+    are newest first, or alphabetical when searching by username prefix. A
+    user whose id equals the search leads the first page, on top of `limit`
+    rows, if it passes the filters.
+    """
+    if search:
+        candidates = USER_INDEX.by_username(search, after)
+    elif premium:
+        candidates = USER_INDEX.premium_newest_first(after)
+    else:
+        candidates = USER_INDEX.newest_first(after)
+    cutoff = now_ms() - INACTIVE_DAYS * 86400 * 1000
+    
+    def matches(user_id):
+        user = USERS.get(user_id)
+        if user is None or user_id == ADMIN_USER_ID:
+            return False
+        if premium and not user.get('is_premium'):
+            return False
+        if low_credits and (user.get('unrestricted') or user['credits'] > LOW_CREDITS_THRESHOLD):
+            return False
+        if inactive and user.get('last_active', user['created_at']) >= cutoff:
+            return False
+        return True
+    
+    # The exact id match is kept out of the prefix listing on every page, so
+    # it is never the cursor and never shows up twice
+    exact = search if search and search in USERS else None
+    page = []
+    for user_id in candidates:
+        if user_id == exact or not matches(user_id):
+            continue
+        page.append(user_id)
+        if len(page) > limit:
+            break
+    
+    has_more = len(page) > limit
+    page = page[:limit]
+    lead = [exact] if exact and after is None and matches(exact) else []
+    return {
+        'users': [admin_user_row(USERS[user_id]) for user_id in lead + page],
+        'next_cursor': page[-1] if has_more else None
+    }
+
 def create_user(username, password, is_premium=False):
     """Create new user with premium option"""
     user_id = generate_user_id()
     credits = PREMIUM_CREDITS if is_premium else FREE_CREDITS
     
-    USERS[user_id] = {
-        'id': user_id,
-        'username': username,
-        'password': hash_password(password),
-        'credits': credits,
-        'is_premium': is_premium,
-        'unrestricted': is_premium,  # Premium users get unrestricted access
-        'created_at': datetime.now().isoformat(),
-        'conversations': []
-    }
+    user = UserRecord(
+        id=user_id,
+        username=username,
+        password=hash_password(password),
+        credits=credits,
+        is_premium=is_premium,
+        unrestricted=is_premium,  # Premium users get unrestricted access
+        created_at=now_ms(),
+        conversations=[]
+    )
+    with _mutation_lock:
+        register_user(user)
+        committed = journal_user(user)
+    wait_durable(committed)
     return user_id
 
+def register_user(user):
+    """Add a UserRecord and keep the admin index and counters in step"""
+    USERS[user.id] = user
+    USER_INDEX.add(user.id, user.username, user.is_premium)
+    bump_stat('users')
+    if user.is_premium:
+        bump_stat('premium_users')
+
+def journal_user(user):
+    return journal('user', user.id, user.username, user.password, user.credits,
+                   user.is_premium, user.unrestricted, user.created_at)
+
+def ensure_admin_user():
+    """Create the admin account if it does not exist yet"""
+    if ADMIN_USER_ID in USERS:
+        return
+    admin = UserRecord(
+        id=ADMIN_USER_ID,
+        username='admin',
+        password=hash_password(ADMIN_PASSWORD),
+        credits=999999,  # Infinite credits for admin
+        is_premium=True,
+        unrestricted=True,
+        created_at=now_ms(),
+        conversations=[]
+    )
+    with _mutation_lock:
+        if ADMIN_USER_ID in USERS:
+            return
+        register_user(admin)
+        journal_user(admin)
+
+# Durable state
+# Every change to users, credits, preferences and conversations is appended to
+# the current journal segment (DATA_DIR/journal-<generation>.log) as a
+# length- and CRC-framed JSON record. A writer thread commits everything
+# queued with one write and one fsync; records that arrive during an fsync
+# form the next batch (group commit). After SNAPSHOT_EVERY records the journal rotates to a new segment,
+# the whole state is written to a JSON snapshot (conversation logs stay as
+# base64 zlib blobs) and the segments before it are deleted. Startup loads the
+# snapshot and replays the segments after it. Records carry absolute values or
+# log positions, so replaying one the snapshot already reflects is harmless.
+JOURNAL = None
+JOURNAL_FRAME = struct.Struct('>II')  # Payload length, CRC-32
+SNAPSHOT_FILE = 'snapshot.bin'
+SNAPSHOT_MAGIC = b'CHATSNAP2\n'
+LOCK_FILE = 'lock'
+_data_dir_lock = None  # Open lock file while this process owns DATA_DIR
+_mutation_lock = threading.RLock()  # Keeps journal order equal to the order changes were made
+
+class Journal:
+    """Append-only mutation log with group commit"""
+    
+    def __init__(self, data_dir, generation, records_since_snapshot=0, commit_ms=JOURNAL_COMMIT_MS):
+        self.data_dir = data_dir
+        self.generation = generation
+        self.records_since_snapshot = records_since_snapshot
+        self.commit_interval = commit_ms / 1000
+        self.commits = 0
+        self.records = 0
+        self.last_snapshot = None
+        self._pending = []
+        self._committed = threading.Event()  # Set when the pending batch is on disk
+        self._lock = threading.Lock()  # Guards _pending
+        self._io_lock = threading.Lock()  # Guards the segment file
+        self._wake = threading.Event()
+        self._snapshotting = False
+        self._file = open(segment_path(data_dir, generation), 'ab')
+        fsync_dir(data_dir)
+        threading.Thread(target=self._run, name='journal-writer', daemon=True).start()
+    
+    def append(self, record):
+        """Queue a record; returns an Event that is set once it is durable"""
+        payload = json_bytes(record)
+        frame = JOURNAL_FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+        with self._lock:
+            self._pending.append(frame)
+            committed = self._committed
+        self._wake.set()
+        return committed
+    
+    def _run(self):
+        while True:
+            self._wake.wait()
+            if self.commit_interval:
+                time.sleep(self.commit_interval)  # Let concurrent writers join this batch
+            self._wake.clear()
+            self.flush()
+            if self.records_since_snapshot >= SNAPSHOT_EVERY and not self._snapshotting:
+                self._snapshotting = True
+                threading.Thread(target=self._snapshot, name='journal-snapshot', daemon=True).start()
+    
+    def _snapshot(self):
+        try:
+            write_snapshot()
+        except Exception:
+            logger.exception("Snapshot failed; the journal is kept")
+        finally:
+            self._snapshotting = False
+    
+    def _commit_pending(self):
+        # Caller holds _io_lock
+        with self._lock:
+            batch, self._pending = self._pending, []
+            committed, self._committed = self._committed, threading.Event()
+        try:
+            if batch:
+                self._file.write(b''.join(batch))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self.commits += 1
+                self.records += len(batch)
+                self.records_since_snapshot += len(batch)
+        except OSError:
+            logger.exception(f"Journal write failed; {len(batch)} records lost")
+        finally:
+            committed.set()
+    
+    def flush(self):
+        with self._io_lock:
+            self._commit_pending()
+    
+    def rotate(self):
+        """Commit what is pending and continue in a new segment; returns its generation"""
+        with self._io_lock:
+            self._commit_pending()
+            self._file.close()
+            self.generation += 1
+            self.records_since_snapshot = 0
+            self._file = open(segment_path(self.data_dir, self.generation), 'ab')
+            fsync_dir(self.data_dir)
+            return self.generation
+    
+    def close(self):
+        with self._io_lock:
+            self._commit_pending()
+            self._file.close()
+    
+    def status(self):
+        return {
+            'generation': self.generation,
+            'records_since_snapshot': self.records_since_snapshot,
+            'records_per_commit': round(self.records / self.commits, 2) if self.commits else None,
+            'last_snapshot': self.last_snapshot
+        }
+
+def journal(*record):
+    """Record a mutation if persistence is on; returns its commit Event or None"""
+    if JOURNAL is not None:
+        return JOURNAL.append(record)
+    return None
+
+def wait_durable(committed):
+    """Block until a journal record from journal() has been fsynced"""
+    if committed is not None:
+        committed.wait()
+
+def segment_path(data_dir, generation):
+    return os.path.join(data_dir, f'journal-{generation:08d}.log')
+
+def journal_segments(data_dir):
+    """(generation, path) of every journal segment, oldest first"""
+    segments = []
+    for name in os.listdir(data_dir):
+        if name.startswith('journal-') and name.endswith('.log'):
+            segments.append((int(name[8:-4]), os.path.join(data_dir, name)))
+    return sorted(segments)
+
+def fsync_dir(path):
+    """Make file creation and renames in path durable, where the OS allows it"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return  # Windows cannot open directories
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def read_segment(path):
+    """Records of a journal segment; a torn tail from a crash is cut off"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    records = []
+    offset = 0
+    header = JOURNAL_FRAME.size
+    while offset + header <= len(data):
+        length, crc = JOURNAL_FRAME.unpack_from(data, offset)
+        payload = data[offset + header:offset + header + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        records.append(json_loads(payload))
+        offset += header + length
+    if offset < len(data):
+        logger.warning(f"Truncating torn journal tail of {path} at byte {offset} of {len(data)}")
+        with open(path, 'r+b') as f:
+            f.truncate(offset)
+    return records
+
+def apply_record(record):
+    """Apply one journal record to the in-memory state"""
+    op = record[0]
+    if op == 'user':
+        _, user_id, username, password, credits, is_premium, unrestricted, created_at = record
+        if user_id not in USERS:
+            register_user(UserRecord(id=user_id, username=username, password=password, credits=credits,
+                                     is_premium=is_premium, unrestricted=unrestricted,
+                                     created_at=created_at, conversations=[]))
+    elif op == 'credits':
+        _, user_id, credits = record
+        if user_id in USERS:
+            USERS[user_id]['credits'] = credits
+    elif op == 'premium':
+        _, user_id, is_premium, credits = record
+        if user_id in USERS:
+            apply_premium(user_id, is_premium, credits)
+    elif op == 'seen':
+        _, user_id, last_active = record
+        if user_id in USERS:
+            USERS[user_id]['last_active'] = last_active
+    elif op == 'pref':
+        _, user_id, key, value = record
+        (USER_IMAGE_MODELS if key == 'model' else USER_IMAGE_COUNTS)[user_id] = value
+    elif op == 'settings':
+        BOT_SETTINGS.update(record[1])
+    elif op == 'conv':
+        _, conv_id, user_id, created_at = record
+        if conv_id not in CONVERSATIONS:
+            register_conversation(ConversationRecord(id=conv_id, user_id=user_id, created_at=created_at,
+                                                     updated_at=created_at, title='New Chat', log=[]))
+    elif op == 'import':
+        _, conv_id, user_id, created_at, updated_at, title, entries = record
+        if conv_id not in CONVERSATIONS:
+            register_conversation(ConversationRecord(id=conv_id, user_id=user_id, created_at=created_at,
+                                                     updated_at=updated_at, title=title,
+                                                     log=[(Role(role), content) for role, content in entries]))
+    elif op == 'conv_del':
+        forget_conversation(record[1])
+    else:
+        conv = CONVERSATIONS.get(record[1])
+        if conv is None:
+            return
+        if op == 'title':
+            _, _, conv.title, conv.updated_at = record
+        elif op == 'turn':
+            _, _, position, user_message, reply, updated_at = record
+            log = conv.log
+            if len(log) == position:  # Longer means the snapshot already has this turn
+                log.extend(((Role.USER, user_message), (Role.ASSISTANT, reply)))
+                conv.updated_at = updated_at
+        elif op == 'log':
+            _, _, entries, updated_at = record
+            conv.log = [(Role(role), content) for role, content in entries]
+            conv.updated_at = updated_at
+
+def capture_state(generation):
+    """The whole durable state as JSON-ready lists, for a snapshot. Caller holds _mutation_lock."""
+    users = [
+        (u.id, u.username, u.password, u.credits, u.is_premium, u.unrestricted, u.created_at, u.get('last_active'))
+        for u in list(USERS.values())
+    ]
+    conversations = []
+    for conv in list(CONVERSATIONS.values()):
+        packed, count = conv.packed()
+        conversations.append((conv.id, conv.user_id, conv.created_at, conv.updated_at, conv.title,
+                              base64.b64encode(packed).decode('ascii'), count))
+    return {
+        'generation': generation,  # Replay starts at this journal segment
+        'created_at': now_ms(),
+        'users': users,
+        'conversations': conversations,
+        'image_models': dict(USER_IMAGE_MODELS),
+        'image_counts': dict(USER_IMAGE_COUNTS),
+        'bot_settings': dict(BOT_SETTINGS)
+    }
+
+def write_snapshot():
+    """Compact the journal: rotate it, snapshot the state, delete older segments"""
+    started = time.perf_counter()
+    # Changes are held off until the capture is done, so it is one consistent
+    # state (no conversation without its user) and everything after it is in
+    # the new segment
+    with _mutation_lock:
+        generation = JOURNAL.rotate()
+        state = capture_state(generation)
+    path = os.path.join(DATA_DIR, SNAPSHOT_FILE)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(json_bytes(state))
+        f.flush()
+        os.fsync(f.fileno())
+        size = f.tell()
+    os.replace(path + '.tmp', path)
+    fsync_dir(DATA_DIR)
+    for segment_generation, segment in journal_segments(DATA_DIR):
+        if segment_generation < generation:
+            os.remove(segment)
+    JOURNAL.last_snapshot = {
+        'generation': generation,
+        'created_at': iso_from_ms(state['created_at']),
+        'bytes': size,
+        'ms': round((time.perf_counter() - started) * 1000, 1)
+    }
+    logger.info(f"Snapshot {generation}: {len(state['users'])} users, "
+                f"{len(state['conversations'])} conversations, {size} bytes")
+
+def load_snapshot(path):
+    """Load a snapshot into the empty state; returns the segment replay starts at"""
+    with open(path, 'rb') as f:
+        if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a snapshot (or was written by an older version)")
+        state = json_loads(f.read())
+    for user_id, username, password, credits, is_premium, unrestricted, created_at, last_active in state['users']:
+        user = UserRecord(id=user_id, username=username, password=password, credits=credits,
+                          is_premium=is_premium, unrestricted=unrestricted, created_at=created_at,
+                          conversations=[])
+        if last_active is not None:
+            user.last_active = last_active
+        register_user(user)
+    # Saved in creation order, so registering rebuilds each user's list in order
+    for conv_id, user_id, created_at, updated_at, title, packed, count in state['conversations']:
+        conv = ConversationRecord(id=conv_id, user_id=user_id, created_at=created_at,
+                                  updated_at=updated_at, title=title)
+        conv.load_packed(base64.b64decode(packed), count)
+        register_conversation(conv)
+    USER_IMAGE_MODELS.update(state['image_models'])
+    USER_IMAGE_COUNTS.update(state['image_counts'])
+    BOT_SETTINGS.update(state['bot_settings'])
+    return state['generation']
+
+def lock_data_dir(path):
+    """Hold an exclusive lock on path/LOCK_FILE for the life of the process.
+    
+    Raises RuntimeError if another process (e.g. a second gunicorn worker)
+    already holds it: two writers would interleave and delete each other's
+    journal segments.
+    """
+    global _data_dir_lock
+    lock = open(os.path.join(path, LOCK_FILE), 'a+b')
+    try:
+        try:
+            import fcntl
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except ImportError:  # Windows
+            import msvcrt
+            msvcrt.locking(lock.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        lock.close()
+        raise RuntimeError(f"{path} is in use by another process; run a single worker per DATA_DIR")
+    _data_dir_lock = lock
+
+def restore_state():
+    """Load the snapshot, replay the journal after it and start journaling"""
+    global JOURNAL
+    started = time.perf_counter()
+    os.makedirs(DATA_DIR, exist_ok=True)
+    lock_data_dir(DATA_DIR)
+    generation = 0
+    snapshot_path = os.path.join(DATA_DIR, SNAPSHOT_FILE)
+    if os.path.exists(snapshot_path):
+        generation = load_snapshot(snapshot_path)
+    segments = journal_segments(DATA_DIR)
+    replayed = 0
+    for segment_generation, segment in segments:
+        if segment_generation < generation:
+            os.remove(segment)  # Left over from a crash right after a snapshot
+            continue
+        records = read_segment(segment)
+        for record in records:
+            apply_record(record)
+        replayed += len(records)
+        if not records:
+            os.remove(segment)
+    last = max([generation] + [segment_generation for segment_generation, _ in segments])
+    JOURNAL = Journal(DATA_DIR, last + 1, records_since_snapshot=replayed)
+    atexit.register(JOURNAL.close)
+    IMPORT_PROFILE['restore_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    logger.info(f"Restored {STATS['users']} users and {STATS['conversations']} conversations "
+                f"({replayed} journal records) in {IMPORT_PROFILE['restore_ms']}ms")
+
 def send_telegram_notification(visitor_info):
     """Send visitor notification to Telegram"""
     if not TELEGRAM_CHAT_ID:
@@ -537,7 +2114,7 @@ Visit your chatbot now!"""
             'text': message
         }
         
-        response = requests.post(url, json=payload, timeout=5)
+        response = get_http_session().post(url, json=payload, timeout=5)
         if response.status_code == 200:
             print(f"✅ Telegram notification sent for {fb_user}")
         else:
@@ -573,7 +2150,7 @@ def send_telegram_conversation(user_id, conv_id, message):
             'text': telegram_message
         }
         
-        response = requests.post(url, json=payload, timeout=5)
+        response = get_http_session().post(url, json=payload, timeout=5)
         return response.status_code == 200
     except Exception as e:
         print(f"❌ Telegram conversation notification failed: {e}")
@@ -582,9 +2159,7 @@ def send_telegram_conversation(user_id, conv_id, message):
 def track_visitor(request):
     """Track visitor information from request"""
     try:
-        ip = request.headers.get('X-Forwarded-For', request.remote_addr)
-        if ip:
-            ip = ip.split(',')[0].strip()
+        ip = get_client_ip(request)
         
         user_agent = request.headers.get('User-Agent', '')
         referer = request.headers.get('Referer', '')
@@ -613,9 +2188,6 @@ def track_visitor(request):
             'referer': referer[:200]
         }
         
-        # Store in session for later use
-        session['visitor_info'] = visitor
-        
         # Only send notification if Telegram is configured
         if TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID:
             send_telegram_notification(visitor)
@@ -626,6 +2198,560 @@ def track_visitor(request):
         print(f"Tracking error: {e}")
         return None, 'Unknown'
 
+# Server-sent events encoding
+# Frames are built as bytes from constant fragments; only the payload varies
+SSE_HEARTBEAT = b": keep-alive\n\n"  # Comment line; clients ignore it, proxies see traffic
+TOKEN_PAYLOAD_PREFIX = b'{"token":'
+DONE_PAYLOAD = b"[DONE]"
+
+def token_payload(text):
+    """The {"token": text} event payload, encoded"""
+    return TOKEN_PAYLOAD_PREFIX + json_bytes(text) + b"}"
+
+def reply_events(pieces, on_complete=None, on_failure=None):
+    """Encode reply text pieces as token payloads followed by [DONE].
+    
+    pieces is a generator that returns False when the reply is not a real
+    upstream answer (busy, degraded, error or fallback text). Then the text is
+    sent again as an error payload and on_failure runs instead of on_complete,
+    so the turn is neither recorded nor paid for. on_complete receives the
+    full reply before [DONE] is sent, so a client that reloads after [DONE]
+    sees the recorded turn.
+    """
+    parts = []
+    while True:
+        try:
+            piece = next(pieces)
+        except StopIteration as stop:
+            ok = stop.value is not False
+            break
+        parts.append(piece)
+        yield token_payload(piece)
+    if not ok:
+        yield json_bytes({"error": ''.join(parts)})
+        if on_failure is not None:
+            on_failure()
+    elif on_complete is not None:
+        on_complete(''.join(parts))
+    yield DONE_PAYLOAD
+
+def sse_event(data, event_id=None):
+    """Frame one SSE event from a bytes payload; multi-line data becomes one data: line per line"""
+    if b"\n" in data:
+        data = data.replace(b"\n", b"\ndata: ")
+    if event_id is None:
+        return b"data: %s\n\n" % data
+    return b"id: %s\ndata: %s\n\n" % (event_id, data)
+
+def sse_response(body):
+    """text/event-stream response that proxies must not buffer or cache"""
+    return Response(body, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+# Resumable chat streams: each assistant turn is buffered under a stream id, so a
+# client that drops mid-reply reconnects with Last-Event-ID instead of re-sending
+CHAT_STREAMS = {}  # stream_id -> ChatStream
+_chat_streams_lock = threading.Lock()
+
+class ChatStream:
+    """Server-side buffer of one assistant turn's SSE events"""
+    
+    def __init__(self, user_id):
+        self.id = uuid.uuid4().hex[:16]
+        self.id_bytes = self.id.encode()
+        self.user_id = user_id
+        self.events = []
+        self.done = False
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.cond = threading.Condition()
+    
+    def run(self, source, on_done=None):
+        """Drain a generator of bytes event payloads into the buffer (runs on the thread pool)"""
+        try:
+            for data in source:
+                with self.cond:
+                    self.events.append(data)
+                    self.cond.notify_all()
+        except Exception as e:
+            with self.cond:
+                self.events.append(json_bytes({"error": str(e)}))
+        finally:
+            with self.cond:
+                self.done = True
+                self.finished_at = time.monotonic()
+                self.cond.notify_all()
+            if on_done:
+                on_done()
+    
+    def follow(self, after=0, heartbeat_interval=SSE_HEARTBEAT_SECONDS):
+        """Yield SSE frames for events after sequence number `after`.
+        
+        Event ids are "<stream_id>:<seq>". A heartbeat comment is sent whenever
+        no event arrives for heartbeat_interval seconds.
+        """
+        seq = after
+        while True:
+            with self.cond:
+                if seq >= len(self.events) and not self.done:
+                    self.cond.wait(heartbeat_interval)
+                pending = self.events[seq:]
+                done = self.done
+            
+            if not pending:
+                if done:
+                    return
+                yield SSE_HEARTBEAT
+                continue
+            
+            for data in pending:
+                seq += 1
+                yield sse_event(data, b"%s:%d" % (self.id_bytes, seq))
+
+def start_chat_stream(user_id, source, on_done=None):
+    """Register a ChatStream and start filling it from `source` in the background.
+    
+    on_done runs once the stream is complete, even if the client has left.
+    """
+    stream = ChatStream(user_id)
+    now = time.monotonic()
+    with _chat_streams_lock:
+        for stream_id, old in list(CHAT_STREAMS.items()):
+            if old.done and now - old.finished_at > CHAT_STREAM_TTL:
+                del CHAT_STREAMS[stream_id]
+            elif now - old.started_at > CHAT_STREAM_MAX_AGE:
+                del CHAT_STREAMS[stream_id]
+        CHAT_STREAMS[stream.id] = stream
+    try:
+        get_executor().submit(stream.run, source, on_done)
+    except Exception:
+        if on_done:
+            on_done()
+        raise
+    return stream
+
+def parse_last_event_id(value):
+    """Split a "<stream_id>:<seq>" event id; returns (None, 0) when malformed"""
+    stream_id, _, seq = (value or '').partition(':')
+    try:
+        return stream_id or None, max(0, int(seq or 0))
+    except ValueError:
+        return None, 0
+
+# Canned command replies, pre-encoded as complete SSE bodies
+COMMAND_REPLY_CACHE = {}  # (command, user_role, is_unrestricted) -> bytes
+
+def encode_sse_reply(text):
+    """Encode a complete reply as a single SSE token event followed by [DONE]"""
+    return sse_event(token_payload(text)) + sse_event(DONE_PAYLOAD)
+
+def sse_reply(body):
+    """Send a pre-encoded SSE body in one write"""
+    return sse_response(body)
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling the chat upstream while its circuit is open"""
+
+class CircuitBreaker:
+    """Circuit breaker over a sliding window of call outcomes.
+    
+    closed: calls go through; the circuit opens when the failure rate (errors
+    plus calls slower than slow_call_seconds) reaches failure_rate.
+    open: calls fail fast for open_seconds.
+    half_open: a limited number of probe calls decide whether to close again.
+    
+    Every state change starts a new generation; outcomes of calls allowed in
+    an earlier generation are ignored, so a slow call from the closed state
+    cannot stand in for a probe.
+    """
+    
+    def __init__(self, window, min_calls, failure_rate, slow_call_seconds, open_seconds, half_open_probes):
+        self.outcomes = deque(maxlen=window)  # True = failed
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = 'closed'
+        self.opened_at = 0
+        self.probes = 0
+        self.trips = 0
+        self.generation = 0
+        self.lock = threading.Lock()
+    
+    def allow_request(self):
+        """Token (generation, is_probe) if a call may go upstream now, else None"""
+        with self.lock:
+            if self.state == 'open':
+                if time.monotonic() - self.opened_at < self.open_seconds:
+                    return None
+                self._set_state('half_open')
+                self.probes = 0
+            if self.state == 'half_open':
+                if self.probes >= self.half_open_probes:
+                    return None
+                self.probes += 1
+                return (self.generation, True)
+            return (self.generation, False)
+    
+    def record(self, token, ok, latency):
+        """Record the outcome of a call allowed with token"""
+        generation, probe = token
+        failed = not ok or latency >= self.slow_call_seconds
+        with self.lock:
+            if generation != self.generation:
+                return
+            if probe:
+                self.probes -= 1
+                if failed:
+                    self._trip()
+                else:
+                    self._set_state('closed')
+                    self.outcomes.clear()
+                return
+            
+            self.outcomes.append(failed)
+            if len(self.outcomes) >= self.min_calls and sum(self.outcomes) / len(self.outcomes) >= self.failure_rate:
+                self._trip()
+    
+    def _set_state(self, state):
+        self.state = state
+        self.generation += 1
+    
+    def _trip(self):
+        self._set_state('open')
+        self.opened_at = time.monotonic()
+        self.outcomes.clear()
+        self.trips += 1
+    
+    def snapshot(self):
+        """State summary for /health"""
+        with self.lock:
+            failures = sum(self.outcomes)
+            return {
+                "state": self.state,
+                "recent_calls": len(self.outcomes),
+                "recent_failures": failures,
+                "trips": self.trips
+            }
+
+upstream_breaker = CircuitBreaker(
+    BREAKER_WINDOW,
+    BREAKER_MIN_CALLS,
+    BREAKER_FAILURE_RATE,
+    BREAKER_SLOW_CALL_SECONDS,
+    BREAKER_OPEN_SECONDS,
+    BREAKER_HALF_OPEN_PROBES
+)
+
+def upstream_payload_key(payload):
+    """SHA-256 of the canonical payload: sorted keys, compact separators, message text trimmed"""
+    canonical = dict(payload)
+    canonical['userInput'] = str(payload.get('userInput', '')).strip()
+    canonical['messages'] = [
+        {'role': m.get('role'), 'content': str(m.get('content', '')).strip()} if isinstance(m, dict) else m
+        for m in payload.get('messages', [])
+    ]
+    encoded = json.dumps(canonical, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    """LRU cache of upstream reply texts with a TTL and entry/byte limits"""
+    
+    def __init__(self, modes, max_entries, max_bytes, ttl):
+        self.modes = modes
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (expires, reply, size), least recently used first
+        self.bytes = 0
+        self.counters = {mode: {'hits': 0, 'misses': 0} for mode in modes}
+        self.evictions = 0
+        self.expirations = 0
+        self.lock = threading.Lock()
+    
+    def enabled(self, mode):
+        return mode in self.modes
+    
+    def get(self, key, mode):
+        """Cached reply for key or None, counted as a hit or miss for mode"""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] <= now:
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.counters[mode]['misses'] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.counters[mode]['hits'] += 1
+            return entry[1]
+    
+    def put(self, key, reply):
+        size = len(reply.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (time.monotonic() + self.ttl, reply, size)
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+    
+    def _remove(self, key):
+        self.bytes -= self.entries.pop(key)[2]
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+    
+    def snapshot(self):
+        """Size and hit/miss counters for /health"""
+        with self.lock:
+            hits = sum(c['hits'] for c in self.counters.values())
+            misses = sum(c['misses'] for c in self.counters.values())
+            return {
+                "modes": sorted(self.modes),
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+                "by_mode": {mode: dict(c) for mode, c in self.counters.items()},
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+class SingleFlight:
+    """Runs one call per key at a time; concurrent callers with the same key share its outcome"""
+    
+    class Flight:
+        __slots__ = ('done', 'result', 'error')
+        
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+    
+    def __init__(self):
+        self.flights = {}  # key -> Flight in progress
+        self.calls = 0  # Calls actually made
+        self.coalesced = 0  # Callers that waited on another caller's call
+        self.lock = threading.Lock()
+    
+    def do(self, key, fn):
+        """fn() for the first caller with key, its outcome for everyone else; returns (result, shared)"""
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is None:
+                flight = self.flights[key] = self.Flight()
+                self.calls += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+        
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                # A copy per waiter: raising the shared object from several
+                # threads would keep rewriting its __traceback__
+                try:
+                    error = copy.copy(flight.error)
+                except Exception:
+                    error = RuntimeError(str(flight.error))
+                raise error from flight.error
+            return flight.result, True
+        
+        try:
+            flight.result = fn()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+        return flight.result, False
+    
+    def snapshot(self):
+        with self.lock:
+            return {
+                "enabled": UPSTREAM_COALESCE,
+                "in_flight": len(self.flights),
+                "calls": self.calls,
+                "coalesced": self.coalesced
+            }
+
+upstream_flights = SingleFlight()
+
+class UpstreamBusy(Exception):
+    """Raised when a call is dropped from the upstream queue (deadline passed or queue full)"""
+
+class FairScheduler:
+    """Bounded concurrency with weighted fair queuing by tier and round robin by user.
+    
+    Up to `concurrency` calls run at once; the rest queue per tier and, within
+    a tier, per user. A free slot goes to the backlogged tier with the lowest
+    pass (stride scheduling: each grant advances the tier's pass by 1/weight,
+    so busy tiers are served in proportion to their weights) and within that
+    tier to the next user in turn, so one user cannot crowd out the rest of
+    the tier. A call still queued at its tier's deadline is dropped. When the
+    queue is full a newcomer displaces the newest waiter of a lower-weight
+    tier, or is refused.
+    """
+    
+    class Waiter:
+        __slots__ = ('tier', 'flow', 'enqueued', 'deadline', 'granted', 'dropped', 'event')
+        
+        def __init__(self, tier, flow, enqueued, deadline):
+            self.tier = tier
+            self.flow = flow
+            self.enqueued = enqueued
+            self.deadline = deadline
+            self.granted = False
+            self.dropped = False
+            self.event = threading.Event()
+    
+    def __init__(self, concurrency, weights, deadlines, max_queue):
+        self.concurrency = concurrency
+        self.weights = weights
+        self.deadlines = deadlines
+        self.max_queue = max_queue
+        self.running = 0
+        self.queued = 0
+        self.queues = {tier: OrderedDict() for tier in weights}  # tier -> flow -> deque of Waiters
+        self.passes = {tier: 0.0 for tier in weights}
+        self.vtime = 0.0  # Pass of the last grant; idle tiers rejoin here instead of with saved-up credit
+        self.stats = {tier: {'dispatched': 0, 'dropped': 0, 'shed': 0, 'waits': deque(maxlen=1000)} for tier in weights}
+        self.lock = threading.Lock()
+    
+    def run(self, tier, flow, fn):
+        """fn() once a slot is granted; raises UpstreamBusy if the call is dropped"""
+        self.acquire(tier, flow)
+        try:
+            return fn()
+        finally:
+            self.release()
+    
+    def acquire(self, tier, flow):
+        if tier not in self.weights:
+            tier = 'free'
+        now = time.monotonic()
+        with self.lock:
+            if self.running < self.concurrency and not self.queued:
+                self.running += 1
+                self._granted(tier, 0.0)
+                return
+            if self.queued >= self.max_queue and not self._shed_below(tier):
+                self.stats[tier]['shed'] += 1
+                raise UpstreamBusy()
+            waiter = self.Waiter(tier, flow, now, now + self.deadlines[tier])
+            queue = self.queues[tier]
+            if not queue:
+                self.passes[tier] = max(self.passes[tier], self.vtime)
+            queue.setdefault(flow, deque()).append(waiter)
+            self.queued += 1
+        
+        waiter.event.wait(waiter.deadline - now)
+        with self.lock:
+            if waiter.granted:
+                return
+            if not waiter.dropped:
+                self._unlink(waiter)
+                waiter.dropped = True
+                self.stats[tier]['dropped'] += 1
+        raise UpstreamBusy()
+    
+    def release(self):
+        with self.lock:
+            self.running -= 1
+            self._dispatch()
+    
+    def _granted(self, tier, waited):
+        self.stats[tier]['dispatched'] += 1
+        self.stats[tier]['waits'].append(waited)
+    
+    def _unlink(self, waiter):
+        queue = self.queues[waiter.tier]
+        waiters = queue[waiter.flow]
+        waiters.remove(waiter)
+        if not waiters:
+            del queue[waiter.flow]
+        self.queued -= 1
+    
+    def _shed_below(self, tier):
+        """Drop the newest waiter of the lowest-weight tier under `tier`; False if there is none"""
+        for lower in sorted(self.weights, key=self.weights.get):
+            if self.weights[lower] >= self.weights[tier]:
+                return False
+            queue = self.queues[lower]
+            if queue:
+                waiter = next(reversed(queue.values()))[-1]
+                self._unlink(waiter)
+                waiter.dropped = True
+                self.stats[lower]['shed'] += 1
+                waiter.event.set()
+                return True
+        return False
+    
+    def _dispatch(self):
+        now = time.monotonic()
+        while self.running < self.concurrency and self.queued:
+            tier = min((t for t, queue in self.queues.items() if queue), key=self.passes.get)
+            queue = self.queues[tier]
+            flow, waiters = next(iter(queue.items()))
+            waiter = waiters.popleft()
+            if waiters:
+                queue.move_to_end(flow)  # Round robin between the tier's users
+            else:
+                del queue[flow]
+            self.queued -= 1
+            if waiter.deadline <= now:
+                waiter.dropped = True
+                self.stats[tier]['dropped'] += 1
+                waiter.event.set()
+                continue
+            self.vtime = self.passes[tier]
+            self.passes[tier] += 1 / self.weights[tier]
+            waiter.granted = True
+            self.running += 1
+            self._granted(tier, now - waiter.enqueued)
+            waiter.event.set()
+    
+    def snapshot(self):
+        """Slots, queue lengths and queue-time percentiles per tier for /health"""
+        with self.lock:
+            tiers = {}
+            for tier, stats in self.stats.items():
+                waits = sorted(stats['waits'])
+                tiers[tier] = {
+                    'weight': self.weights[tier],
+                    'queued': sum(len(waiters) for waiters in self.queues[tier].values()),
+                    'dispatched': stats['dispatched'],
+                    'dropped': stats['dropped'],
+                    'shed': stats['shed'],
+                    'queue_ms_p50': round(waits[len(waits) // 2] * 1000, 1) if waits else None,
+                    'queue_ms_p95': round(waits[int(len(waits) * 0.95)] * 1000, 1) if waits else None
+                }
+            return {
+                'concurrency': self.concurrency,
+                'running': self.running,
+                'queued': self.queued,
+                'tiers': tiers
+            }
+
+upstream_scheduler = FairScheduler(UPSTREAM_CONCURRENCY, SCHEDULER_WEIGHTS, SCHEDULER_DEADLINES, UPSTREAM_QUEUE_LIMIT)
+
+upstream_cache = ResponseCache(UPSTREAM_CACHE_MODES, UPSTREAM_CACHE_ENTRIES, UPSTREAM_CACHE_MAX_BYTES, UPSTREAM_CACHE_TTL)
+
 # Image generation task storage
 IMAGE_GENERATION_TASKS = {}
 IMAGE_GENERATION_RESULTS = {}
@@ -672,8 +2798,16 @@ Always provide clear, well-structured responses with proper formatting when rele
 Current User: {username} | Role: {user_role} | Credits: {credits}
 
 Created by: JHONWILSON | Version: Unrestricted Edition"""
+        
+        self.degraded_reply = "⚠️ The AI service is temporarily unavailable. Please try again in a minute."
+        self.busy_reply = "⏳ The AI service is busy right now. Please try again in a moment."
 
-    def process_streaming(self, msg, mode, hist, username, user_role, credits):
+    def process_streaming(self, msg, mode, hist, username, user_role, credits, user_id=None):
+        """Yield the reply as text pieces (see reply_events for encoding).
+        
+        Returns True for an upstream reply, False when the pieces are a
+        stand-in (fallback, busy, degraded or error text).
+        """
         try:
             # Use unrestricted prompt for all users
             prompt = self.unrestricted_prompt.format(
@@ -687,7 +2821,7 @@ Created by: JHONWILSON | Version: Unrestricted Edition"""
             if mode == 'image':
                 msg = f"{prompt}\n\nUser wants to generate an image: {msg}. Provide detailed guidance on using /gen command with optimal parameters."
             
-            msgs = hist[-10:] if len(hist) > 10 else hist.copy()  # Increased context window
+            msgs = hist[-CONTEXT_MESSAGES:] if len(hist) > CONTEXT_MESSAGES else hist.copy()  # Increased context window
             msgs.append({"role": "user", "content": msg})
             
             payload = {
@@ -702,31 +2836,88 @@ Created by: JHONWILSON | Version: Unrestricted Edition"""
                 "topP": 0.95  # More diverse responses
             }
             
-            res = requests.post(self.url, headers=self.headers, json=payload, timeout=60)  # Increased timeout
-            res.raise_for_status()
-            data = res.json()
+            data, cached = self.complete(payload, mode, user_role, user_id or username)
             
             if "message" in data and data.get("success"):
                 reply = data["message"]
+                if cached:
+                    yield reply  # Complete already; nothing to pace
+                    return True
                 
                 words = reply.split(' ')
                 for i, word in enumerate(words):
-                    yield json.dumps({"token": word + (' ' if i < len(words)-1 else '')}) + '\n'
+                    yield word + (' ' if i < len(words)-1 else '')
                     time.sleep(0.02)  # Faster streaming
-                
-                yield "data: [DONE]\n\n"
+                return True
             else:
                 # Fallback response
                 fallback = f"I'll help you with that. As an unrestricted assistant, I can provide detailed information on '{msg}'. What specific aspects would you like me to elaborate on?"
                 words = fallback.split(' ')
                 for i, word in enumerate(words):
-                    yield json.dumps({"token": word + (' ' if i < len(words)-1 else '')}) + '\n'
+                    yield word + (' ' if i < len(words)-1 else '')
                     time.sleep(0.02)
-                yield "data: [DONE]\n\n"
+                return False
                 
+        except UpstreamUnavailable:
+            # Degraded reply while the circuit is open - no upstream wait
+            yield self.degraded_reply
+        
+        except UpstreamBusy:
+            # Dropped from the upstream queue (deadline passed or shed for a higher tier)
+            yield self.busy_reply
+        
         except Exception as e:
             error_msg = f"I encountered an error: {str(e)}. Please try again or rephrase your request."
-            yield json.dumps({"token": error_msg}) + '\n'
+            yield error_msg
+        return False
+
+    def complete(self, payload, mode, tier='free', flow=None):
+        """Upstream reply for payload as (data, cached).
+        
+        Served from upstream_cache when enabled for mode; otherwise concurrent
+        identical payloads of the same tier share one upstream call
+        (upstream_flights), which waits its turn in upstream_scheduler under the
+        first caller's tier and flow (user). Keying flights by tier keeps a
+        premium caller from waiting behind, or being dropped with, a free
+        caller's queued call.
+        """
+        cacheable = upstream_cache.enabled(mode)
+        key = upstream_payload_key(payload) if cacheable or UPSTREAM_COALESCE else None
+        if cacheable:
+            reply = upstream_cache.get(key, mode)
+            if reply is not None:
+                return {"success": True, "message": reply}, True
+        
+        call = lambda: upstream_scheduler.run(tier, flow, lambda: self.call_upstream(payload))
+        if UPSTREAM_COALESCE:
+            data, shared = upstream_flights.do((tier, key), call)
+        else:
+            data, shared = call(), False
+        if cacheable and not shared and data.get("success") and isinstance(data.get("message"), str):
+            upstream_cache.put(key, data["message"])
+        return data, False
+    
+    def call_upstream(self, payload):
+        """POST to the chat upstream through the circuit breaker"""
+        token = upstream_breaker.allow_request()
+        if token is None:
+            raise UpstreamUnavailable()
+        
+        started = time.monotonic()
+        try:
+            res = get_http_session().post(
+                self.url,
+                headers=self.headers,
+                json=payload,
+                timeout=(UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUT)
+            )
+            res.raise_for_status()
+            data = res.json()
+        except Exception:
+            upstream_breaker.record(token, False, time.monotonic() - started)
+            raise
+        upstream_breaker.record(token, True, time.monotonic() - started)
+        return data
 
 ai = Assistant()
 
@@ -1145,9 +3336,40 @@ HTML_TEMPLATE = r"""
             text-overflow: ellipsis;
         }
         
-        .conversation-date {
+        .conversation-date {
+            font-size: 0.75rem;
+            color: var(--text-secondary);
+        }
+        
+        .conversation-search {
+            width: 100%;
+            margin-top: 0.75rem;
+            padding: 0.625rem 0.875rem;
+            background: var(--bg-tertiary);
+            border: 1px solid var(--border);
+            border-radius: var(--radius-md);
+            color: var(--text-primary);
+            font-size: 0.875rem;
+        }
+        
+        .conversation-search:focus {
+            outline: none;
+            border-color: var(--primary);
+        }
+        
+        .conversation-snippet {
             font-size: 0.75rem;
             color: var(--text-secondary);
+            display: -webkit-box;
+            -webkit-line-clamp: 2;
+            -webkit-box-orient: vertical;
+            overflow: hidden;
+        }
+        
+        .conversation-item mark {
+            background: var(--primary-light);
+            color: var(--text-primary);
+            border-radius: 2px;
         }
         
         .conversation-delete {
@@ -2154,6 +4376,7 @@ HTML_TEMPLATE = r"""
                     <span>➕</span>
                     <span>New Chat</span>
                 </button>
+                <input type="search" id="conversationSearch" class="conversation-search" placeholder="🔍 Search conversations..." oninput="searchConversations()">
             </div>
             
             <div class="conversations-list" id="conversationsList">
@@ -2161,6 +4384,11 @@ HTML_TEMPLATE = r"""
             </div>
             
             <div class="sidebar-bottom">
+                <div style="display: flex; gap: 0.5rem; justify-content: center; font-size: 0.75rem;">
+                    <a href="/api/conversations/export" download style="color: var(--text-secondary);">⬇️ Export chats</a>
+                    <a href="#" onclick="document.getElementById('importFile').click(); return false;" style="color: var(--text-secondary);">⬆️ Import chats</a>
+                    <input type="file" id="importFile" accept=".ndjson,.jsonl,application/x-ndjson" style="display: none;" onchange="importConversations(this)">
+                </div>
                 <div style="text-align: center; color: var(--text-secondary); font-size: 0.75rem; padding: 0.5rem;">
                     Powered by <strong style="color: var(--primary);">{{ bot_name }}</strong>
                 </div>
@@ -2295,12 +4523,19 @@ HTML_TEMPLATE = r"""
                 <div id="userManagement" class="tab-content">
                     <div class="form-group">
                         <label>Search User</label>
-                        <input type="text" id="searchUser" placeholder="Search by username or ID..." oninput="searchUsers()">
+                        <input type="text" id="searchUser" placeholder="Search by username prefix or ID..." oninput="searchUsers()">
+                        <select id="userFilter" onchange="loadUsers()" style="margin-top: 0.5rem; width: 100%; padding: 0.75rem; background: var(--bg-tertiary); color: var(--text-primary); border: 1px solid var(--border); border-radius: var(--radius-md);">
+                            <option value="">All users</option>
+                            <option value="premium">Premium</option>
+                            <option value="low_credits">Low credits</option>
+                            <option value="inactive">Inactive</option>
+                        </select>
                     </div>
                     
                     <div id="userList" style="max-height: 300px; overflow-y: auto; margin-top: 1rem;">
                         <h3 style="color: var(--text-secondary); font-size: 0.875rem; margin-bottom: 0.5rem;">Users ({{ users_count if users_count else 0 }})</h3>
                         <div id="userData"></div>
+                        <button id="loadMoreUsers" onclick="loadUsers(true)" style="display: none; width: 100%; margin-top: 0.75rem; padding: 0.75rem; background: var(--bg-tertiary); color: var(--text-primary); border: 1px solid var(--border); border-radius: var(--radius-md); cursor: pointer;">Load more</button>
                     </div>
                     
                     <div class="form-group" style="margin-top: 1rem;">
@@ -2498,6 +4733,7 @@ HTML_TEMPLATE = r"""
         let selectedUserId = null;
         let currentModelId = 'nanobanana';
         let currentImageCount = 1;
+        let AVAILABLE_MODELS = {};  // Filled from /api/bootstrap
         let currentImageTaskId = null;
         let imageGenerationInterval = null;
         let maxImageCount = {{ 20 if user_role in ['admin', 'premium'] else 5 }};
@@ -2543,6 +4779,32 @@ HTML_TEMPLATE = r"""
                 });
             }
             
+            // Re-window the sidebar and the message list while scrolling
+            const conversationsList = document.getElementById('conversationsList');
+            if (conversationsList) {
+                let listFrame = null;
+                conversationsList.addEventListener('scroll', function() {
+                    if (!listFrame) {
+                        listFrame = requestAnimationFrame(() => {
+                            listFrame = null;
+                            renderConversationsList(false);
+                        });
+                    }
+                }, { passive: true });
+            }
+            
+            if (chat) {
+                let chatFrame = null;
+                chat.addEventListener('scroll', function() {
+                    if (!chatFrame) {
+                        chatFrame = requestAnimationFrame(() => {
+                            chatFrame = null;
+                            updateMessageWindow();
+                        });
+                    }
+                }, { passive: true });
+            }
+            
             // Click outside to close sidebar on mobile
             document.addEventListener('click', function(e) {
                 if (window.innerWidth <= 1024 && sidebar && !sidebar.contains(e.target) && !e.target.closest('.sidebar-toggle')) {
@@ -2557,9 +4819,6 @@ HTML_TEMPLATE = r"""
                 }
             });
             
-            // Initialize models in image modal
-            initializeModels();
-            
             // Setup image count slider
             const imageCountSlider = document.getElementById('imageCount');
             const imageCountValue = document.getElementById('imageCountValue');
@@ -2571,9 +4830,6 @@ HTML_TEMPLATE = r"""
                     currentImageCount = parseInt(this.value);
                 });
             }
-            
-            // Load user preferences
-            loadUserPreferences();
         });
         
         // Check for commands in input
@@ -2673,18 +4929,7 @@ HTML_TEMPLATE = r"""
         
         // Initialize models in modal
         function initializeModels() {
-            const models = {
-                "1": {"id": "nanobanana", "name": "🍌 Nanobanana (Basic)", "desc": "Fast, basic quality"},
-                "2": {"id": "nanobanana2", "name": "🍌 Nanobanana Pro", "desc": "Enhanced quality"},
-                "3": {"id": "Seedream4", "name": "🌱 Seedream 4 (UNDERMAINTENANCE)", "desc": "Artistic style"},
-                "4": {"id": "qwen", "name": "🤖 Qwen", "desc": "Balanced quality"},
-                "5": {"id": "gpt_1low", "name": "⚡ GPT-1 Low", "desc": "Fast generation"},
-                "6": {"id": "gpt_1medium", "name": "🎯 GPT-1 Medium", "desc": "Better quality"},
-                "7": {"id": "flux_kontext_pro", "name": "✨ Flux Kontext Pro", "desc": "Premium quality"},
-                "8": {"id": "flux_2_pro", "name": "🚀 Flux Kontext Pro 2", "desc": "Version 2 of Kontext Pro"},
-                "9": {"id": "clipfly_2", "name": "🎬 Clipfly 2", "desc": "Clipfly version"},
-                "10": {"id": "midjourney_v7", "name": "🎨 Midjourney V7", "desc": "Midjourney V7 - more detailed textures"}
-            };
+            const models = AVAILABLE_MODELS;
             
             const modelSelector = document.getElementById('modelSelector');
             if (modelSelector) {
@@ -2724,29 +4969,33 @@ HTML_TEMPLATE = r"""
                 const data = await response.json();
                 
                 if (data.success) {
-                    currentModelId = data.preferences.model || 'nanobanana';
-                    currentImageCount = data.preferences.image_count || 1;
-                    
-                    // Update UI
-                    const modelBtns = document.querySelectorAll('.model-btn');
-                    modelBtns.forEach(btn => {
-                        if (btn.dataset.modelId === currentModelId) {
-                            btn.classList.add('active');
-                        }
-                    });
-                    
-                    const imageCountSlider = document.getElementById('imageCount');
-                    const imageCountValue = document.getElementById('imageCountValue');
-                    if (imageCountSlider && imageCountValue) {
-                        imageCountSlider.value = currentImageCount;
-                        imageCountValue.textContent = currentImageCount;
-                    }
+                    applyPreferences(data.preferences);
                 }
             } catch (err) {
                 console.error('Error loading preferences:', err);
             }
         }
         
+        function applyPreferences(preferences) {
+            currentModelId = preferences.model || 'nanobanana';
+            currentImageCount = preferences.image_count || 1;
+            
+            // Update UI
+            const modelBtns = document.querySelectorAll('.model-btn');
+            modelBtns.forEach(btn => {
+                if (btn.dataset.modelId === currentModelId) {
+                    btn.classList.add('active');
+                }
+            });
+            
+            const imageCountSlider = document.getElementById('imageCount');
+            const imageCountValue = document.getElementById('imageCountValue');
+            if (imageCountSlider && imageCountValue) {
+                imageCountSlider.value = currentImageCount;
+                imageCountValue.textContent = currentImageCount;
+            }
+        }
+        
         // Save user preference
         async function saveUserPreference(key, value) {
             try {
@@ -2812,7 +5061,7 @@ HTML_TEMPLATE = r"""
             wrapper.appendChild(avatar);
             wrapper.appendChild(content);
             loadingMsg.appendChild(wrapper);
-            chat.appendChild(loadingMsg);
+            appendChatNode(loadingMsg);
             chat.scrollTop = chat.scrollHeight;
             
             return loadingMsg;
@@ -3156,7 +5405,7 @@ HTML_TEMPLATE = r"""
             wrapper.appendChild(avatar);
             wrapper.appendChild(content);
             msg.appendChild(wrapper);
-            chat.appendChild(msg);
+            appendChatNode(msg);
             chat.scrollTop = chat.scrollHeight;
         }
         
@@ -3197,7 +5446,7 @@ HTML_TEMPLATE = r"""
             wrapper.appendChild(avatar);
             wrapper.appendChild(content);
             msg.appendChild(wrapper);
-            chat.appendChild(msg);
+            appendChatNode(msg);
             chat.scrollTop = chat.scrollHeight;
         }
         
@@ -3401,6 +5650,7 @@ HTML_TEMPLATE = r"""
         function toggleSidebar() {
             if (sidebar) {
                 sidebar.classList.toggle('visible');
+                renderConversationsList(false);
                 if (sidebarIcon) {
                     sidebarIcon.textContent = sidebar.classList.contains('visible') ? '✕' : '☰';
                 }
@@ -3431,13 +5681,31 @@ HTML_TEMPLATE = r"""
             }
         }
         
+        // Last credit state from /api/credits and its ETag; polls send the
+        // ETag back and an unchanged state comes back as an empty 304
+        let creditState = null;
+        let creditEtag = null;
+        
+        async function fetchCredits() {
+            const headers = creditEtag ? {'If-None-Match': creditEtag} : {};
+            const response = await fetch('/api/credits', {headers: headers, cache: 'no-store'});
+            if (response.status === 304 && creditState) {
+                return creditState;
+            }
+            const data = await response.json();
+            if (data.success) {
+                creditState = data;
+                creditEtag = response.headers.get('ETag');
+            }
+            return data;
+        }
+        
         // Check if user has credits - renamed to avoid conflict with Python function
         async function checkUserCredits() {
             if (isUnrestricted) return true;
             
             try {
-                const response = await fetch('/api/check-credits');
-                const data = await response.json();
+                const data = await fetchCredits();
                 
                 if (!data.has_credits) {
                     showStatus('❌ Insufficient credits!', 'error');
@@ -3454,8 +5722,7 @@ HTML_TEMPLATE = r"""
         // Get current credits
         async function getCurrentCredits() {
             try {
-                const response = await fetch('/api/get-credits');
-                const data = await response.json();
+                const data = await fetchCredits();
                 if (data.success) {
                     updateCreditsDisplay(data.credits);
                     return data.credits;
@@ -3516,44 +5783,155 @@ HTML_TEMPLATE = r"""
         
         // Initialize app
         async function initialize() {
-            await loadConversations();
-            if (Object.keys(conversations).length === 0) {
+            await loadBootstrap();
+            if (conversationOrder.length === 0) {
                 await createNewChat();
             } else {
-                const sorted = Object.values(conversations).sort((a, b) => 
-                    new Date(b.updated_at) - new Date(a.updated_at)
-                );
-                if (sorted.length > 0) {
-                    await switchConversation(sorted[0].id);
-                }
+                await switchConversation(conversationOrder[0]);
+            }
+        }
+        
+        // Load the user, credits, preferences, model catalog and the first
+        // page of conversation summaries in a single request
+        async function loadBootstrap() {
+            try {
+                const response = await fetch('/api/bootstrap');
+                const data = await response.json();
+                if (!data.success) throw new Error(data.error || 'Bootstrap failed');
+                
+                userRole = data.user.role;
+                isAdmin = data.user.is_admin;
+                isUnrestricted = data.user.is_unrestricted;
+                maxImageCount = data.user.max_image_count;
+                
+                AVAILABLE_MODELS = data.models;
+                initializeModels();
+                applyPreferences(data.preferences);
+                updateCreditsDisplay(data.credits.credits);
+                creditState = {success: true, ...data.credits};
+                creditEtag = data.credits_etag;
+                
+                conversations = {};
+                addConversationSummaries(data.conversations);
+            } catch (err) {
+                console.error('Failed to load conversations:', err);
+                showStatus('❌ Failed to load conversations', 'error');
             }
         }
         
-        // Load conversations
-        async function loadConversations() {
+        // Conversation summaries are paged; the rest load as the sidebar scrolls
+        let conversationsNextOffset = null;
+        let loadingConversations = false;
+        
+        function addConversationSummaries(page) {
+            page.items.forEach(summary => {
+                if (!conversations[summary.id]) conversations[summary.id] = summary;
+            });
+            conversationsNextOffset = page.has_more ? page.next_offset : null;
+            rebuildConversationOrder();
+            renderConversationsList();
+        }
+        
+        async function loadMoreConversations() {
+            if (conversationsNextOffset === null || loadingConversations) return;
+            loadingConversations = true;
             try {
-                const response = await fetch('/api/conversations');
+                const response = await fetch(`/api/conversations?view=summary&offset=${conversationsNextOffset}`);
                 const data = await response.json();
                 if (data.success) {
-                    conversations = data.conversations;
-                    renderConversationsList();
+                    addConversationSummaries(data.conversations);
                 }
             } catch (err) {
                 console.error('Failed to load conversations:', err);
-                showStatus('❌ Failed to load conversations', 'error');
+            } finally {
+                loadingConversations = false;
+            }
+        }
+        
+        // Upload an export file; the server reads it line by line
+        async function importConversations(input) {
+            const file = input.files[0];
+            input.value = '';
+            if (!file) return;
+            showStatus('⏳ Importing conversations...');
+            try {
+                const response = await fetch('/api/conversations/import', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/x-ndjson' },
+                    body: file
+                });
+                const data = await response.json();
+                if (!data.success) throw new Error(data.error || 'Import failed');
+                
+                const skipped = data.skipped ? ` (${data.skipped} lines skipped)` : '';
+                if (data.stopped) {
+                    showStatus(`⚠️ Imported ${data.imported} conversations, then stopped: ${data.stopped}` + skipped, 'error');
+                } else {
+                    showStatus(`✅ Imported ${data.imported} conversations` + skipped);
+                }
+                conversationsNextOffset = 0;
+                await loadMoreConversations();
+            } catch (err) {
+                showStatus('❌ Failed to import conversations', 'error');
+            }
+        }
+        
+        // Conversation ids, newest first. Kept sorted incrementally so the
+        // sidebar never re-sorts (or re-parses dates) on every message.
+        let conversationOrder = [];
+        
+        function conversationTime(convId) {
+            const conv = conversations[convId];
+            if (conv._ts === undefined) conv._ts = Date.parse(conv.updated_at) || 0;
+            return conv._ts;
+        }
+        
+        function rebuildConversationOrder() {
+            conversationOrder = Object.keys(conversations);
+            conversationOrder.sort((a, b) => conversationTime(b) - conversationTime(a));
+        }
+        
+        function removeFromConversationOrder(convId) {
+            const i = conversationOrder.indexOf(convId);
+            if (i !== -1) conversationOrder.splice(i, 1);
+        }
+        
+        function insertIntoConversationOrder(convId) {
+            removeFromConversationOrder(convId);
+            const ts = conversationTime(convId);
+            let lo = 0, hi = conversationOrder.length;
+            while (lo < hi) {
+                const mid = (lo + hi) >> 1;
+                if (conversationTime(conversationOrder[mid]) > ts) lo = mid + 1;
+                else hi = mid;
             }
+            conversationOrder.splice(lo, 0, convId);
+        }
+        
+        // Mark a conversation as updated now and move it to the top
+        function touchConversation(convId) {
+            const conv = conversations[convId];
+            if (!conv) return;
+            conv.updated_at = new Date().toISOString();
+            conv._ts = Date.now();
+            removeFromConversationOrder(convId);
+            conversationOrder.unshift(convId);
         }
         
-        // Render conversations list
-        function renderConversationsList() {
+        // Windowed sidebar: only rows inside the visible range (plus overscan)
+        // are in the DOM; spacers stand in for the rest.
+        const CONVERSATION_OVERSCAN = 8;
+        let conversationRowHeight = 0;  // Measured from the first rendered row
+        let conversationRange = null;
+        let conversationSearchQuery = '';  // Non-empty while search results are shown
+        
+        function renderConversationsList(force = true) {
             const list = document.getElementById('conversationsList');
-            if (!list) return;
+            if (!list || conversationSearchQuery) return;  // Search results stay until the query is cleared
             
-            const sortedConvs = Object.values(conversations).sort((a, b) => 
-                new Date(b.updated_at) - new Date(a.updated_at)
-            );
-
-            if (sortedConvs.length === 0) {
+            const total = conversationOrder.length;
+            if (total === 0) {
+                conversationRange = null;
                 list.innerHTML = `
                     <div style="text-align: center; padding: 2rem; color: var(--text-secondary);">
                         <div style="font-size: 3rem; margin-bottom: 1rem;">💬</div>
@@ -3563,10 +5941,25 @@ HTML_TEMPLATE = r"""
                 `;
                 return;
             }
-
-            list.innerHTML = sortedConvs.map(conv => {
-                const date = new Date(conv.updated_at);
-                const now = new Date();
+            
+            const rowHeight = conversationRowHeight || 76;
+            const viewport = list.clientHeight || window.innerHeight;
+            const first = Math.max(0, Math.floor(list.scrollTop / rowHeight) - CONVERSATION_OVERSCAN);
+            const last = Math.min(total, Math.ceil((list.scrollTop + viewport) / rowHeight) + CONVERSATION_OVERSCAN);
+            
+            if (!force && conversationRange && conversationRange[0] === first && conversationRange[1] === last) {
+                return;
+            }
+            conversationRange = [first, last];
+            
+            if (last === total && conversationsNextOffset !== null) {
+                loadMoreConversations();
+            }
+            
+            const now = new Date();
+            const rows = conversationOrder.slice(first, last).map(convId => {
+                const conv = conversations[convId];
+                const date = new Date(conversationTime(convId));
                 const diffMs = now - date;
                 const diffMins = Math.floor(diffMs / 60000);
                 const diffHours = Math.floor(diffMs / 3600000);
@@ -3590,6 +5983,72 @@ HTML_TEMPLATE = r"""
                     </div>
                 `;
             }).join('');
+            
+            list.innerHTML = `<div style="height: ${first * rowHeight}px;"></div>${rows}<div style="height: ${(total - last) * rowHeight}px;"></div>`;
+            
+            if (!conversationRowHeight) {
+                const row = list.querySelector('.conversation-item');
+                if (row && row.offsetHeight) {
+                    conversationRowHeight = row.offsetHeight + parseFloat(getComputedStyle(row).marginBottom || 0);
+                    renderConversationsList();
+                }
+            }
+        }
+        
+        // Conversation search: while a query is set, ranked results replace
+        // the windowed list
+        let conversationSearchTimer = null;
+        
+        function searchConversations() {
+            clearTimeout(conversationSearchTimer);
+            conversationSearchTimer = setTimeout(runConversationSearch, 250);
+        }
+        
+        async function runConversationSearch() {
+            const query = document.getElementById('conversationSearch').value.trim();
+            conversationSearchQuery = query;
+            if (!query) {
+                renderConversationsList();
+                return;
+            }
+            try {
+                const response = await fetch(`/api/conversations/search?q=${encodeURIComponent(query)}`);
+                const data = await response.json();
+                if (data.success && query === conversationSearchQuery) {
+                    renderSearchResults(data);
+                }
+            } catch (err) {
+                showStatus('❌ Search failed', 'error');
+            }
+        }
+        
+        // Escape text and wrap the search terms in <mark>; terms are word characters only
+        function highlightTerms(text, terms) {
+            if (!terms.length) return escapeHtml(text);
+            const pattern = new RegExp('(' + terms.join('|') + ')', 'giu');
+            return text.split(pattern).map((part, i) => i % 2 ? `<mark>${escapeHtml(part)}</mark>` : escapeHtml(part)).join('');
+        }
+        
+        function renderSearchResults(data) {
+            const list = document.getElementById('conversationsList');
+            if (!list) return;
+            conversationRange = null;
+            list.scrollTop = 0;
+            if (data.results.length === 0) {
+                list.innerHTML = `
+                    <div style="text-align: center; padding: 2rem; color: var(--text-secondary);">
+                        <p>No conversations match</p>
+                    </div>
+                `;
+                return;
+            }
+            list.innerHTML = data.results.map(item => `
+                <div class="conversation-item ${item.id === currentConversationId ? 'active' : ''}" 
+                     onclick="switchConversation('${item.id}')">
+                    <div class="conversation-title">${highlightTerms(item.title, data.terms)}</div>
+                    ${item.snippet ? `<div class="conversation-snippet">${highlightTerms(item.snippet.text, data.terms)}</div>` : ''}
+                </div>
+            `).join('');
         }
         
         // Create new chat
@@ -3604,9 +6063,9 @@ HTML_TEMPLATE = r"""
                         created_at: new Date().toISOString(),
                         updated_at: new Date().toISOString(),
                         title: 'New Chat',
-                        messages: [],
-                        history: []
+                        messages: []
                     };
+                    insertIntoConversationOrder(data.conversation_id);
                     
                     await switchConversation(data.conversation_id);
                     renderConversationsList();
@@ -3622,17 +6081,28 @@ HTML_TEMPLATE = r"""
             }
         }
         
-        // Switch conversation
+        // Switch conversation. Only the newest page of messages is fetched;
+        // conv.messages keeps each message at its position in the conversation,
+        // with holes below conv.loadedFrom until older pages are loaded.
         async function switchConversation(convId) {
             try {
-                const response = await fetch(`/api/conversation/${convId}`);
+                const response = await fetch(`/api/conversation/${convId}/messages?limit=${MESSAGE_PAGE}`);
                 const data = await response.json();
                 
                 if (data.success) {
                     currentConversationId = convId;
-                    conversations[convId] = data.conversation;
+                    const known = conversations[convId];
+                    const conv = data.conversation;
+                    conv.messages = new Array(data.start).concat(data.messages);
+                    conv.loadedFrom = data.start;
+                    conversations[convId] = conv;
+                    if (known && known._ts !== undefined) {
+                        conv._ts = known._ts;  // Keep the sidebar position
+                    } else {
+                        insertIntoConversationOrder(convId);
+                    }
                     
-                    renderConversation(data.conversation);
+                    renderConversation(conv);
                     renderConversationsList();
                     
                     // Dispatch event for sidebar closing on mobile
@@ -3645,7 +6115,48 @@ HTML_TEMPLATE = r"""
             }
         }
         
-        // Render conversation messages
+        // Windowed message list. Only a window of messages near the viewport
+        // is in the DOM: older pages are rendered (and fetched, see
+        // loadOlderMessages) when scrolling up, and messages far out of view
+        // are swapped for spacers of their measured height.
+        const MESSAGE_PAGE = 30;
+        const MAX_RENDERED_MESSAGES = 90;
+        const MESSAGE_GAP = 24;  // .chat-container gap (1.5rem)
+        const MESSAGE_PRELOAD_PX = 400;
+        let messageView = null;
+        
+        function buildMessageElement(msg, index) {
+            const msgEl = document.createElement('div');
+            msgEl.className = 'message ' + msg.role;
+            msgEl.dataset.index = index;
+            
+            const wrapper = document.createElement('div');
+            wrapper.className = 'message-wrapper';
+            
+            const avatar = document.createElement('div');
+            avatar.className = 'avatar ' + msg.role;
+            
+            if (msg.role === 'user') {
+                avatar.textContent = '👤';
+            } else {
+                if (botAvatarType === 'image' && botAvatarUrl) {
+                    avatar.innerHTML = `<img src="${botAvatarUrl}" alt="Bot">`;
+                } else {
+                    avatar.textContent = botAvatar;
+                }
+            }
+            
+            const content = document.createElement('div');
+            content.className = 'message-content';
+            content.innerHTML = msg.role === 'bot' ? formatText(msg.content) : escapeHtml(msg.content);
+            
+            wrapper.appendChild(avatar);
+            wrapper.appendChild(content);
+            msgEl.appendChild(wrapper);
+            return msgEl;
+        }
+        
+        // Render conversation messages (newest page only)
         function renderConversation(conv) {
             if (!chat) return;
             
@@ -3688,42 +6199,186 @@ HTML_TEMPLATE = r"""
                 chat.innerHTML = welcomeMessage;
             }
             
-            // Render saved messages
-            if (conv.messages && conv.messages.length > 0) {
-                conv.messages.forEach(msg => {
-                    const msgEl = document.createElement('div');
-                    msgEl.className = 'message ' + msg.role;
-                    
-                    const wrapper = document.createElement('div');
-                    wrapper.className = 'message-wrapper';
-                    
-                    const avatar = document.createElement('div');
-                    avatar.className = 'avatar ' + msg.role;
-                    
-                    if (msg.role === 'user') {
-                        avatar.textContent = '👤';
-                    } else {
-                        if (botAvatarType === 'image' && botAvatarUrl) {
-                            avatar.innerHTML = `<img src="${botAvatarUrl}" alt="Bot">`;
-                        } else {
-                            avatar.textContent = botAvatar;
-                        }
-                    }
-                    
-                    const content = document.createElement('div');
-                    content.className = 'message-content';
-                    content.innerHTML = msg.role === 'bot' ? formatText(msg.content) : escapeHtml(msg.content);
-                    
-                    wrapper.appendChild(avatar);
-                    wrapper.appendChild(content);
-                    msgEl.appendChild(wrapper);
-                    chat.appendChild(msgEl);
-                });
+            const messages = conv.messages || [];
+            messageView = {
+                conv: conv,
+                start: Math.max(conv.loadedFrom || 0, messages.length - MESSAGE_PAGE),
+                end: messages.length,
+                heights: [],     // Measured height (plus gap) of messages swapped for spacers
+                topPx: 0,
+                bottomPx: 0,
+                topSpacer: document.createElement('div'),
+                bottomSpacer: document.createElement('div')
+            };
+            
+            chat.appendChild(messageView.topSpacer);
+            for (let i = messageView.start; i < messageView.end; i++) {
+                chat.appendChild(buildMessageElement(messages[i], i));
             }
+            chat.appendChild(messageView.bottomSpacer);
+            setSpacerHeights(messageView);
             
             chat.scrollTop = chat.scrollHeight;
         }
         
+        function setSpacerHeights(view) {
+            view.topSpacer.style.height = view.topPx + 'px';
+            view.bottomSpacer.style.height = view.bottomPx + 'px';
+            view.topSpacer.style.display = view.topPx ? '' : 'none';
+            view.bottomSpacer.style.display = view.bottomPx ? '' : 'none';
+        }
+        
+        // Swap rendered messages [from, to) for spacer height
+        function releaseMessages(view, from, to, atTop) {
+            const nodes = chat.querySelectorAll('.message[data-index]');
+            let released = 0;
+            nodes.forEach(node => {
+                const index = parseInt(node.dataset.index);
+                if (index >= from && index < to) {
+                    view.heights[index] = node.offsetHeight + MESSAGE_GAP;
+                    released += view.heights[index];
+                    node.remove();
+                }
+            });
+            if (atTop) {
+                view.topPx += released;
+            } else {
+                // Untracked nodes after the last message (command output, image
+                // results) are hidden rather than removed - they are never
+                // re-rendered - and shown again once the window reaches the end
+                let node = view.bottomSpacer.previousSibling;
+                while (node && !node.dataset?.index) {
+                    node.dataset.parked = '1';
+                    node.style.display = 'none';
+                    node = node.previousSibling;
+                }
+                view.bottomPx += released;
+            }
+        }
+        
+        // Where the next page goes: before any parked trailing nodes
+        function bottomAnchor(view) {
+            return chat.querySelector('[data-parked]') || view.bottomSpacer;
+        }
+        
+        function unparkNodes() {
+            chat.querySelectorAll('[data-parked]').forEach(node => {
+                delete node.dataset.parked;
+                node.style.display = '';
+            });
+        }
+        
+        function updateMessageWindow() {
+            const view = messageView;
+            if (!view || !chat) return;
+            const messages = view.conv.messages || [];
+            
+            if (chat.scrollTop < view.topPx + MESSAGE_PRELOAD_PX && view.start > 0) {
+                const loadedFrom = view.conv.loadedFrom || 0;
+                if (view.start <= loadedFrom) {
+                    loadOlderMessages(view.conv);  // Comes back here once the page arrives
+                    return;
+                }
+                // Render the previous page, keeping the visible content in place
+                const newStart = Math.max(loadedFrom, view.start - MESSAGE_PAGE);
+                const before = chat.scrollHeight;
+                const fragment = document.createDocumentFragment();
+                for (let i = newStart; i < view.start; i++) {
+                    fragment.appendChild(buildMessageElement(messages[i], i));
+                    view.topPx -= view.heights[i] || 0;
+                }
+                view.topPx = Math.max(0, view.topPx);
+                view.topSpacer.after(fragment);
+                view.start = newStart;
+                
+                // A reply being streamed is not tracked yet, so keep the bottom
+                // of the window rendered until it finishes
+                if (view.end - view.start > MAX_RENDERED_MESSAGES && !processing) {
+                    const cut = view.start + MAX_RENDERED_MESSAGES;
+                    releaseMessages(view, cut, view.end, false);
+                    view.end = cut;
+                }
+                setSpacerHeights(view);
+                chat.scrollTop += chat.scrollHeight - before;
+            } else if (chat.scrollTop + chat.clientHeight > chat.scrollHeight - view.bottomPx - MESSAGE_PRELOAD_PX && view.end < messages.length) {
+                // Render the next page back from the bottom spacer
+                const newEnd = Math.min(messages.length, view.end + MESSAGE_PAGE);
+                const fragment = document.createDocumentFragment();
+                for (let i = view.end; i < newEnd; i++) {
+                    fragment.appendChild(buildMessageElement(messages[i], i));
+                    view.bottomPx -= view.heights[i] || 0;
+                }
+                view.bottomPx = Math.max(0, view.bottomPx);
+                bottomAnchor(view).before(fragment);
+                view.end = newEnd;
+                if (view.end === messages.length) unparkNodes();
+                
+                if (view.end - view.start > MAX_RENDERED_MESSAGES) {
+                    const cut = view.end - MAX_RENDERED_MESSAGES;
+                    releaseMessages(view, view.start, cut, true);
+                    view.start = cut;
+                }
+                setSpacerHeights(view);
+            }
+        }
+        
+        // Fetch the page of messages before conv.loadedFrom
+        async function loadOlderMessages(conv) {
+            const before = conv.loadedFrom;
+            if (conv.loadingOlder || !before) return;
+            conv.loadingOlder = true;
+            let loaded = false;
+            try {
+                const response = await fetch(`/api/conversation/${conv.id}/messages?before=${before}&limit=${MESSAGE_PAGE}`);
+                const data = await response.json();
+                
+                if (data.success && conv.loadedFrom === before) {
+                    data.messages.forEach((msg, i) => { conv.messages[data.start + i] = msg; });
+                    conv.loadedFrom = data.start;
+                    loaded = true;
+                }
+            } catch (err) {
+                showStatus('❌ Failed to load older messages', 'error');
+            } finally {
+                conv.loadingOlder = false;
+            }
+            if (loaded && messageView && messageView.conv === conv) {
+                updateMessageWindow();
+            }
+        }
+        
+        // Append a node at the end of the chat, jumping to the latest messages first
+        function appendChatNode(node) {
+            if (messageView && messageView.end < (messageView.conv.messages || []).length) {
+                // The rebuild clears the chat; carry the parked untracked nodes over
+                const parked = Array.from(chat.querySelectorAll('[data-parked]'));
+                renderConversation(messageView.conv);
+                parked.forEach(parkedNode => messageView.bottomSpacer.before(parkedNode));
+                unparkNodes();
+            }
+            if (messageView && messageView.bottomSpacer.parentNode === chat) {
+                chat.insertBefore(node, messageView.bottomSpacer);
+            } else {
+                chat.appendChild(node);
+            }
+            
+            // Keep the DOM bounded while a long thread grows
+            if (messageView && messageView.end - messageView.start > MAX_RENDERED_MESSAGES) {
+                const cut = messageView.end - MAX_RENDERED_MESSAGES;
+                releaseMessages(messageView, messageView.start, cut, true);
+                messageView.start = cut;
+                setSpacerHeights(messageView);
+            }
+        }
+        
+        // Tag a message created by createMessage() as conversation message `index`
+        function trackMessageNode(content, index) {
+            const node = content && content.closest('.message');
+            if (!node || !messageView) return;
+            node.dataset.index = index;
+            messageView.end = index + 1;
+        }
+        
         // Delete conversation
         async function deleteConversation(convId) {
             if (!confirm('Are you sure you want to delete this conversation?')) return;
@@ -3734,11 +6389,11 @@ HTML_TEMPLATE = r"""
                 
                 if (data.success) {
                     delete conversations[convId];
+                    removeFromConversationOrder(convId);
                     
                     if (currentConversationId === convId) {
-                        const remaining = Object.keys(conversations);
-                        if (remaining.length > 0) {
-                            await switchConversation(remaining[0]);
+                        if (conversationOrder.length > 0) {
+                            await switchConversation(conversationOrder[0]);
                         } else {
                             await createNewChat();
                         }
@@ -3764,7 +6419,7 @@ HTML_TEMPLATE = r"""
                 
                 if (data.success) {
                     conversations[currentConversationId].messages = [];
-                    conversations[currentConversationId].history = [];
+                    conversations[currentConversationId].loadedFrom = 0;
                     renderConversation(conversations[currentConversationId]);
                     showStatus('✅ Conversation cleared');
                 }
@@ -3825,7 +6480,7 @@ HTML_TEMPLATE = r"""
             wrapper.appendChild(avatar);
             wrapper.appendChild(content);
             msg.appendChild(wrapper);
-            chat.appendChild(msg);
+            appendChatNode(msg);
             chat.scrollTop = chat.scrollHeight;
             
             return content;
@@ -3838,6 +6493,115 @@ HTML_TEMPLATE = r"""
             if (chat) chat.scrollTop = chat.scrollHeight;
         }
         
+        // Incremental SSE parser. Partial lines are buffered across reads, so an
+        // event split over several network chunks is never dropped. Comment
+        // lines (server heartbeats) are skipped.
+        function createSSEParser(onEvent) {
+            let buffer = '';
+            let data = [];
+            let id = null;
+            
+            return function feed(text) {
+                buffer += text;
+                let start = 0;
+                let nl;
+                while ((nl = buffer.indexOf('\n', start)) !== -1) {
+                    let line = buffer.slice(start, nl);
+                    start = nl + 1;
+                    if (line.endsWith('\r')) line = line.slice(0, -1);
+                    
+                    if (line === '') {
+                        if (data.length) onEvent({ id: id, data: data.join('\n') });
+                        data = [];
+                        continue;
+                    }
+                    if (line[0] === ':') continue;
+                    
+                    const colon = line.indexOf(':');
+                    const field = colon === -1 ? line : line.slice(0, colon);
+                    let value = colon === -1 ? '' : line.slice(colon + 1);
+                    if (value[0] === ' ') value = value.slice(1);
+                    
+                    if (field === 'data') data.push(value);
+                    else if (field === 'id') id = value;
+                }
+                buffer = buffer.slice(start);
+            };
+        }
+        
+        // Streaming renderer for bot replies. Completed lines are formatted once
+        // and appended; only the trailing open block (last line or unfinished
+        // code fence) is re-formatted. DOM writes happen once per animation frame.
+        function createStreamRenderer(content) {
+            return {
+                content: content,
+                text: '',
+                committed: 0,  // text[0:committed] is already in the DOM
+                boundary: 0,   // last line break outside a code fence
+                scanPos: 0,
+                inFence: false,
+                tail: null,
+                frame: null
+            };
+        }
+        
+        function streamAppend(renderer, token) {
+            renderer.text += token;
+            if (!renderer.frame) {
+                renderer.frame = requestAnimationFrame(() => flushStream(renderer));
+            }
+        }
+        
+        function flushStream(renderer) {
+            renderer.frame = null;
+            if (!renderer.content) return;
+            
+            if (!renderer.tail) {
+                renderer.content.innerHTML = '';  // Drop the typing indicator
+                renderer.tail = document.createElement('span');
+                renderer.content.appendChild(renderer.tail);
+            }
+            
+            // Advance the commit boundary over newly completed lines
+            const text = renderer.text;
+            let nl;
+            while ((nl = text.indexOf('\n', renderer.scanPos)) !== -1) {
+                const fences = (text.slice(renderer.scanPos, nl).match(/```/g) || []).length;
+                if (fences % 2) renderer.inFence = !renderer.inFence;
+                renderer.scanPos = nl + 1;
+                if (!renderer.inFence) renderer.boundary = renderer.scanPos;
+            }
+            
+            const stickToBottom = chat && chat.scrollHeight - chat.scrollTop - chat.clientHeight < 80;
+            
+            if (renderer.boundary > renderer.committed) {
+                renderer.tail.insertAdjacentHTML('beforebegin', formatText(text.slice(renderer.committed, renderer.boundary)));
+                renderer.committed = renderer.boundary;
+            }
+            renderer.tail.innerHTML = formatText(text.slice(renderer.committed));
+            
+            if (stickToBottom) chat.scrollTop = chat.scrollHeight;
+        }
+        
+        // Render anything still pending and stop the frame loop
+        function finishStream(renderer) {
+            if (renderer.frame) {
+                cancelAnimationFrame(renderer.frame);
+            }
+            if (renderer.text) {
+                flushStream(renderer);
+            }
+            renderer.frame = null;
+            return renderer.text;
+        }
+        
+        function cancelStream(renderer) {
+            if (renderer && renderer.frame) {
+                cancelAnimationFrame(renderer.frame);
+                renderer.frame = null;
+            }
+        }
+        
         // Send message function
         async function sendMessage() {
             if (processing) {
@@ -3878,78 +6642,118 @@ HTML_TEMPLATE = r"""
             input.style.height = 'auto';
             sendBtn.disabled = true;
             
-            createMessage('user', msg);
+            const userMessage = createMessage('user', msg);
             currentBotMessage = createMessage('bot');
+            let renderer = null;
 
             try {
                 const conv = conversations[currentConversationId];
                 
-                const response = await fetch('/chat', {
+                let response = await fetch('/chat', {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
                     body: JSON.stringify({
                         message: msg,
                         mode: mode,
-                        history: conv.history || [],
                         conversation_id: currentConversationId
                     })
                 });
                 
+                if (response.status === 429) {
+                    const retryAfter = response.headers.get('Retry-After') || '1';
+                    throw new Error(`Too many requests - please wait ${retryAfter}s and try again`);
+                }
+                
                 if (!response.ok) {
                     const errorText = await response.text();
                     throw new Error(`Server error: ${response.status} - ${errorText}`);
                 }
 
-                const reader = response.body.getReader();
-                const decoder = new TextDecoder();
-                let fullText = '';
-
+                renderer = createStreamRenderer(currentBotMessage);
+                
+                let streamDone = false;
+                let streamError = null;
+                let lastEventId = response.headers.get('X-Stream-Id') ? response.headers.get('X-Stream-Id') + ':0' : null;
+                const onEvent = event => {
+                    if (event.id) lastEventId = event.id;
+                    if (event.data === '[DONE]') {
+                        streamDone = true;
+                        return;
+                    }
+                    let parsed;
+                    try {
+                        parsed = JSON.parse(event.data);
+                    } catch (e) {
+                        return;
+                    }
+                    if (parsed.token) {
+                        streamAppend(renderer, parsed.token);
+                    } else if (parsed.error) {
+                        streamError = parsed.error;
+                    }
+                };
+                
+                // Read the stream; if the connection drops before [DONE], resume
+                // from the last delivered event instead of re-sending the message
+                let resumeAttempts = 0;
                 while (true) {
-                    const {done, value} = await reader.read();
-                    if (done) break;
+                    try {
+                        const reader = response.body.getReader();
+                        const decoder = new TextDecoder();
+                        const feed = createSSEParser(onEvent);
+                        while (!streamDone) {
+                            const {done, value} = await reader.read();
+                            if (done) break;
+                            feed(decoder.decode(value, { stream: true }));
+                        }
+                    } catch (e) {
+                        if (!lastEventId) throw e;
+                    }
                     
-                    const chunk = decoder.decode(value);
-                    const lines = chunk.split('\n');
+                    if (streamDone || streamError || !lastEventId || resumeAttempts >= 3) break;
                     
-                    for (const line of lines) {
-                        if (line.startsWith('data: ')) {
-                            const data = line.slice(6);
-                            if (data === '[DONE]') {
-                                break;
-                            }
-                            
-                            try {
-                                const parsed = JSON.parse(data);
-                                if (parsed.token) {
-                                    fullText += parsed.token;
-                                    updateBotMessage(currentBotMessage, fullText);
-                                } else if (parsed.error) {
-                                    throw new Error(parsed.error);
-                                }
-                            } catch (e) {
-                                // Ignore JSON parsing errors for incomplete chunks
-                            }
-                        }
+                    resumeAttempts++;
+                    showStatus('🔄 Connection lost, resuming reply...', 'warning');
+                    await new Promise(resolve => setTimeout(resolve, 500 * resumeAttempts));
+                    try {
+                        response = await fetch('/chat/resume', { headers: { 'Last-Event-ID': lastEventId } });
+                    } catch (e) {
+                        continue;
                     }
+                    if (response.status === 429) {
+                        const retryAfter = parseInt(response.headers.get('Retry-After')) || 1;
+                        await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+                        continue;
+                    }
+                    if (!response.ok) break;
+                }
+                
+                // A reply cut off before [DONE] is not final; the server still
+                // records the full turn, which a reload shows
+                if (!streamDone && !streamError) {
+                    streamError = 'Connection lost before the reply finished. Reload the conversation to see it.';
+                }
+                
+                if (streamError) {
+                    throw new Error(streamError);
                 }
 
-                // Save to conversation
-                conv.history = conv.history || [];
+                const fullText = finishStream(renderer);
+                
+                // The server has recorded the turn; mirror it locally
                 conv.messages = conv.messages || [];
                 
-                conv.history.push({role: 'user', content: msg});
-                conv.history.push({role: 'assistant', content: fullText});
                 conv.messages.push({role: 'user', content: msg});
                 conv.messages.push({role: 'bot', content: fullText});
-                conv.updated_at = new Date().toISOString();
+                touchConversation(currentConversationId);
+                trackMessageNode(userMessage, conv.messages.length - 2);
+                trackMessageNode(currentBotMessage, conv.messages.length - 1);
                 
                 // Update title if first message
                 if (conv.messages.length === 2) {
                     conv.title = msg.substring(0, 50) + (msg.length > 50 ? '...' : '');
                 }
                 
-                // Save conversation
-                await saveConversation(currentConversationId);
                 renderConversationsList();
                 
                 // Update credits display for non-unrestricted users
@@ -3968,6 +6772,7 @@ HTML_TEMPLATE = r"""
 
             } catch (err) {
                 console.error('Error in sendMessage:', err);
+                cancelStream(renderer);
                 if (currentBotMessage) {
                     updateBotMessage(currentBotMessage, '❌ Error: ' + err.message);
                 }
@@ -4112,19 +6917,6 @@ HTML_TEMPLATE = r"""
             }
         }
         
-        // Save conversation
-        async function saveConversation(convId) {
-            try {
-                await fetch(`/api/conversation/${convId}/save`, {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify(conversations[convId])
-                });
-            } catch (err) {
-                console.error('Failed to save conversation:', err);
-            }
-        }
-        
         // Utility functions
         function escapeHtml(text) {
             const div = document.createElement('div');
@@ -4306,67 +7098,88 @@ HTML_TEMPLATE = r"""
             }
         }
         
-        async function loadUsers() {
+        // Admin user list, fetched a page at a time; search and filters run server side
+        let usersCursor = null;
+        let usersSearchTimer = null;
+        
+        function userItemHtml(u) {
+            const date = new Date(u.created_at);
+            const dateStr = date.toLocaleDateString();
+            const isSelected = u.id === selectedUserId;
+            const userRole = u.is_premium ? 'premium' : 'free';
+            const roleColor = userRole === 'premium' ? 'var(--premium)' : 
+                             userRole === 'admin' ? 'var(--primary)' : 'var(--text-secondary)';
+            
+            return `
+                <div class="user-item" 
+                     data-user-id="${u.id}" 
+                     data-user-name="${u.username}"
+                     data-user-credits="${u.credits}"
+                     data-user-role="${userRole}"
+                     onclick="selectUser(this)"
+                     style="background: ${isSelected ? 'var(--primary-light)' : 'var(--bg-tertiary)'}; 
+                            padding: 1rem; 
+                            border-radius: var(--radius-md); 
+                            border: 1px solid ${isSelected ? 'var(--primary)' : 'var(--border)'}; 
+                            cursor: pointer;
+                            transition: all 0.2s;">
+                    <div style="display: flex; justify-content: space-between; align-items: flex-start; margin-bottom: 0.5rem;">
+                        <div style="flex: 1;">
+                            <div style="display: flex; align-items: center; gap: 0.5rem; margin-bottom: 0.25rem;">
+                                <strong style="color: ${roleColor};">${u.username}</strong>
+                                <span style="font-size: 0.75rem; background: var(--bg-secondary); padding: 0.125rem 0.5rem; border-radius: var(--radius-sm); color: var(--text-secondary);">ID: ${u.id}</span>
+                                ${u.is_premium ? '<span style="font-size: 0.75rem; background: var(--premium); color: white; padding: 0.125rem 0.5rem; border-radius: var(--radius-sm); font-weight: 600;">💎 PREMIUM</span>' : ''}
+                            </div>
+                            <div style="font-size: 0.75rem; color: var(--text-secondary);">
+                                Created: ${dateStr} • Conversations: ${u.conversation_count || 0}
+                            </div>
+                        </div>
+                        <span style="font-weight: 700; color: ${u.credits > 0 ? 'var(--success)' : 'var(--danger)'}; font-size: 1.125rem;">
+                            ${u.credits}
+                        </span>
+                    </div>
+                </div>
+            `;
+        }
+        
+        async function loadUsers(more = false) {
+            const params = new URLSearchParams();
+            const searchInput = document.getElementById('searchUser');
+            const filterSelect = document.getElementById('userFilter');
+            const query = searchInput ? searchInput.value.trim() : '';
+            if (query) params.set('q', query);
+            if (filterSelect && filterSelect.value) params.set('filter', filterSelect.value);
+            if (more && usersCursor) params.set('cursor', usersCursor);
+            
             try {
-                const response = await fetch('/admin/users');
+                const response = await fetch('/admin/users?' + params.toString());
                 const data = await response.json();
                 
                 if (data.success) {
                     const userData = document.getElementById('userData');
+                    const loadMoreBtn = document.getElementById('loadMoreUsers');
+                    usersCursor = data.next_cursor;
+                    if (loadMoreBtn) loadMoreBtn.style.display = usersCursor ? 'block' : 'none';
+                    
+                    const html = data.users.map(userItemHtml).join('');
+                    if (more) {
+                        const items = document.getElementById('userItems');
+                        if (items) items.insertAdjacentHTML('beforeend', html);
+                        return;
+                    }
+                    
                     if (data.users.length === 0) {
                         userData.innerHTML = `
                             <div style="text-align: center; padding: 2rem; color: var(--text-muted);">
                                 <div style="font-size: 3rem; margin-bottom: 1rem;">👥</div>
                                 <p>No users found</p>
-                                <p style="font-size: 0.875rem; margin-top: 0.5rem;">Users will appear here when they register</p>
+                                <p style="font-size: 0.875rem; margin-top: 0.5rem;">${query || (filterSelect && filterSelect.value) ? 'Try a different search or filter' : 'Users will appear here when they register'}</p>
                             </div>
                         `;
                         return;
                     }
                     
-                    let html = '<div style="display: flex; flex-direction: column; gap: 0.75rem;">';
-                    data.users.forEach(u => {
-                        const date = new Date(u.created_at);
-                        const dateStr = date.toLocaleDateString();
-                        const isSelected = u.id === selectedUserId;
-                        const userRole = u.is_premium ? 'premium' : 'free';
-                        const roleColor = userRole === 'premium' ? 'var(--premium)' : 
-                                         userRole === 'admin' ? 'var(--primary)' : 'var(--text-secondary)';
-                        
-                        html += `
-                            <div class="user-item" 
-                                 data-user-id="${u.id}" 
-                                 data-user-name="${u.username}"
-                                 data-user-credits="${u.credits}"
-                                 data-user-role="${userRole}"
-                                 onclick="selectUser(this)"
-                                 style="background: ${isSelected ? 'var(--primary-light)' : 'var(--bg-tertiary)'}; 
-                                        padding: 1rem; 
-                                        border-radius: var(--radius-md); 
-                                        border: 1px solid ${isSelected ? 'var(--primary)' : 'var(--border)'}; 
-                                        cursor: pointer;
-                                        transition: all 0.2s;">
-                                <div style="display: flex; justify-content: space-between; align-items: flex-start; margin-bottom: 0.5rem;">
-                                    <div style="flex: 1;">
-                                        <div style="display: flex; align-items: center; gap: 0.5rem; margin-bottom: 0.25rem;">
-                                            <strong style="color: ${roleColor};">${u.username}</strong>
-                                            <span style="font-size: 0.75rem; background: var(--bg-secondary); padding: 0.125rem 0.5rem; border-radius: var(--radius-sm); color: var(--text-secondary);">ID: ${u.id}</span>
-                                            ${u.is_premium ? '<span style="font-size: 0.75rem; background: var(--premium); color: white; padding: 0.125rem 0.5rem; border-radius: var(--radius-sm); font-weight: 600;">💎 PREMIUM</span>' : ''}
-                                        </div>
-                                        <div style="font-size: 0.75rem; color: var(--text-secondary);">
-                                            Created: ${dateStr} • Conversations: ${u.conversation_count || 0}
-                                        </div>
-                                    </div>
-                                    <span style="font-weight: 700; color: ${u.credits > 0 ? 'var(--success)' : 'var(--danger)'}; font-size: 1.125rem;">
-                                        ${u.credits}
-                                    </span>
-                                </div>
-                            </div>
-                        `;
-                    });
-                    html += '</div>';
-                    
-                    userData.innerHTML = html;
+                    userData.innerHTML = `<div id="userItems" style="display: flex; flex-direction: column; gap: 0.75rem;">${html}</div>`;
                 }
             } catch (err) {
                 console.error('Could not load users:', err);
@@ -4596,19 +7409,8 @@ HTML_TEMPLATE = r"""
         }
         
         function searchUsers() {
-            const query = document.getElementById('searchUser').value.toLowerCase();
-            const userItems = document.querySelectorAll('.user-item');
-            
-            userItems.forEach(item => {
-                const username = item.dataset.userName.toLowerCase();
-                const userId = item.dataset.userId.toLowerCase();
-                
-                if (username.includes(query) || userId.includes(query)) {
-                    item.style.display = 'block';
-                } else {
-                    item.style.display = 'none';
-                }
-            });
+            clearTimeout(usersSearchTimer);
+            usersSearchTimer = setTimeout(() => loadUsers(), 250);
         }
         
         async function addCreditsToUser() {
@@ -4707,6 +7509,7 @@ HTML_TEMPLATE = r"""
                 sidebar.classList.remove('visible');
                 if (sidebarIcon) sidebarIcon.textContent = '☰';
             }
+            renderConversationsList(false);
         });
         
         // Initialize responsive behavior
@@ -4720,13 +7523,31 @@ HTML_TEMPLATE = r"""
 </html>
 """
 
+# Cold start measurement: time taken by the first request this process serves
+@app.before_request
+def mark_first_request():
+    if COLD_START['first_request_ms'] is None:
+        g.cold_start_began = time.perf_counter()
+
+@app.before_request
+def start_app_on_first_request():
+    """Restore from DATA_DIR when the server loaded `app` without create_app()"""
+    if not _app_started:
+        create_app()
+
+@app.after_request
+def record_first_request(response):
+    began = g.pop('cold_start_began', None)
+    if began is not None and COLD_START['first_request_ms'] is None:
+        COLD_START['first_request_ms'] = round((time.perf_counter() - began) * 1000, 2)
+    return response
+
 @app.route('/')
 def home():
     if 'user_id' not in session:
         fb_user, fb_source = track_visitor(request)
         
-        return render_template_string(
-            HTML_TEMPLATE,
+        return render_html(
             bot_name=BOT_SETTINGS['name'],
             bot_avatar=BOT_SETTINGS['avatar'],
             bot_avatar_type=BOT_SETTINGS['avatar_type'],
@@ -4749,8 +7570,7 @@ def home():
     user_role = 'admin' if is_admin else 'premium' if is_premium else 'free'
     is_unrestricted = is_admin and ADMIN_UNLIMITED or is_premium
     
-    return render_template_string(
-        HTML_TEMPLATE,
+    return render_html(
         bot_name=BOT_SETTINGS['name'],
         bot_avatar=BOT_SETTINGS['avatar'],
         bot_avatar_type=BOT_SETTINGS['avatar_type'],
@@ -4765,8 +7585,8 @@ def home():
         is_admin=is_admin,
         admin_unlimited=ADMIN_UNLIMITED,
         is_unrestricted=is_unrestricted,
-        users_count=len(USERS) - 1,  # Exclude admin
-        premium_users_count=len([u for u in USERS.values() if u.get('is_premium')])
+        users_count=STATS['users'] - (ADMIN_USER_ID in USERS),  # Exclude admin
+        premium_users_count=STATS['premium_users']
     )
 
 @app.route('/login', methods=['POST'])
@@ -4787,17 +7607,7 @@ def login():
             session['username'] = 'admin'
             
             # Initialize admin user if not exists
-            if ADMIN_USER_ID not in USERS:
-                USERS[ADMIN_USER_ID] = {
-                    'id': ADMIN_USER_ID,
-                    'username': 'admin',
-                    'password': hash_password(ADMIN_PASSWORD),
-                    'credits': 999999,  # Infinite credits for admin
-                    'is_premium': True,
-                    'unrestricted': True,
-                    'created_at': datetime.now().isoformat(),
-                    'conversations': []
-                }
+            ensure_admin_user()
             
             return jsonify({"success": True, "is_admin": True})
         
@@ -4817,6 +7627,8 @@ def login():
         # Set session
         session['user_id'] = user_id
         session['username'] = username
+        USERS[user_id]['last_active'] = now_ms()
+        journal('seen', user_id, USERS[user_id]['last_active'])
         
         return jsonify({"success": True, "is_admin": False})
         
@@ -4828,60 +7640,60 @@ def logout():
     session.clear()
     return redirect(url_for('home'))
 
-@app.route('/chat', methods=['POST'])
-@login_required
-def chat():
-    try:
-        user_id = session['user_id']
-        username = session['username']
-        
-        # Get user info
-        user_info = USERS.get(user_id, {})
-        user_role = 'admin' if user_id == ADMIN_USER_ID else 'premium' if user_info.get('is_premium') else 'free'
-        credits = user_info.get('credits', 0)
-        is_unrestricted = (user_id == ADMIN_USER_ID and ADMIN_UNLIMITED) or user_info.get('unrestricted', False)
-        
-        # For non-unrestricted users, still check credits
-        if not is_unrestricted:
-            if not user_has_credits(user_id):
-                return jsonify({"error": "Insufficient credits"}), 403
-        
-        data = request.json
-        msg = data.get('message', '').strip()
-        conv_id = data.get('conversation_id')
-        
-        if not msg:
-            return jsonify({"error": "Empty message"}), 400
-        
-        # Use credit for non-unrestricted users
-        if not is_unrestricted:
-            if not use_credit(user_id):
-                return jsonify({"error": "Failed to use credit"}), 500
-        
-        # Update conversation title if first message
-        if conv_id and conv_id in CONVERSATIONS:
-            if len(CONVERSATIONS[conv_id]['messages']) == 0:
-                update_conversation_title(conv_id, msg)
-        
-        # Send notification to Telegram
-        send_telegram_conversation(user_id, conv_id, msg)
+# Chat commands
+# Registered handlers are looked up by the message's first token, so ordinary
+# messages pay a single character check before going upstream. A message that
+# does not match a command exactly (extra words, or an admin command sent by
+# someone else) goes to the model like any other message.
+CHAT_COMMANDS = {}  # '!name' -> {'name', 'handler', 'cost', 'cache', 'admin_only', 'takes_args', 'help'}
 
-        
-        # Handle special commands
-        if msg.lower().startswith('!unlock'):
-            if user_id == ADMIN_USER_ID:
-                parts = msg.split()
-                if len(parts) > 1:
-                    target_user = parts[1]
-                    for uid, user in USERS.items():
-                        if user['username'] == target_user:
-                            user['is_premium'] = True
-                            user['unrestricted'] = True
-                            user['credits'] = PREMIUM_CREDITS
-                            return jsonify({"response": f"✅ Premium access unlocked for {target_user}"})
-        
-        if msg.lower() == '!premium':
-            info = f"""
+def chat_command(name, cost=1, cache=None, admin_only=False, takes_args=False, help=''):
+    """Register a chat command.
+
+    cost: credits charged to restricted users, like any message.
+    cache: None to render on every call, 'role' to reuse one reply per role.
+    takes_args: match "!name arg ..." rather than only the bare "!name".
+    A handler takes the command context and returns the reply text.
+    """
+    def decorator(f):
+        CHAT_COMMANDS[name] = {
+            'name': name,
+            'handler': f,
+            'cost': cost,
+            'cache': cache,
+            'admin_only': admin_only,
+            'takes_args': takes_args,
+            'help': help
+        }
+        return f
+    return decorator
+
+def match_chat_command(msg, is_admin=False):
+    """Return (command, args) for a registered command message, else (None, None)"""
+    if msg[:1] != '!':
+        return None, None
+    parts = msg.split()
+    command = CHAT_COMMANDS.get(parts[0].lower())
+    if command is None or (command['admin_only'] and not is_admin):
+        return None, None
+    if len(parts) > 1 and not command['takes_args']:
+        return None, None
+    return command, parts[1:]
+
+def run_chat_command(command, ctx):
+    """Run a command handler, serving role-cached replies from COMMAND_REPLY_CACHE"""
+    if command['cache'] == 'role':
+        key = (command['name'], ctx['user_role'], ctx['is_unrestricted'])
+        body = COMMAND_REPLY_CACHE.get(key)
+        if body is None:
+            body = COMMAND_REPLY_CACHE[key] = encode_sse_reply(command['handler'](ctx))
+        return sse_reply(body)
+    
+    return sse_reply(encode_sse_reply(command['handler'](ctx)))
+
+@chat_command('!premium', cache='role', help='Premium features info')
+def premium_command(ctx):
+    return f"""
             🏆 PREMIUM FEATURES:
             
             ✅ UNRESTRICTED ACCESS:
@@ -4902,73 +7714,168 @@ def chat():
             • Advanced API access (coming soon)
             • Priority support
             
-            Current Status: You are {user_role.upper()}{' 🚀' if is_unrestricted else ''}
+            Current Status: You are {ctx['user_role'].upper()}{' 🚀' if ctx['is_unrestricted'] else ''}
             """
-            
-            def generate():
-                words = info.split(' ')
-                for i, word in enumerate(words):
-                    yield f"data: {json.dumps({'token': word + (' ' if i < len(words)-1 else '')})}\n\n"
-                    time.sleep(0.01)
-                yield "data: [DONE]\n\n"
-            
-            return Response(generate(), mimetype='text/event-stream')
-        
-        if msg.lower() == '!status':
-            status_msg = f"""
+
+@chat_command('!help', cache='role', help='Show all commands')
+def help_command(ctx):
+    is_admin = ctx['user_role'] == 'admin'
+    lines = [
+        f"• {name} - {command['help']}"
+        for name, command in CHAT_COMMANDS.items()
+        if is_admin or not command['admin_only']
+    ]
+    return "Commands:\n" + "\n".join(lines)
+
+@chat_command('!status', help='Show account status')
+def status_command(ctx):
+    is_unrestricted = ctx['is_unrestricted']
+    status_msg = f"""
             👤 USER STATUS:
             
-            Username: {username}
-            Role: {user_role.upper()}{' 🚀' if is_unrestricted else ''}
-            Credits: {'UNLIMITED' if is_unrestricted else credits}
+            Username: {ctx['username']}
+            Role: {ctx['user_role'].upper()}{' 🚀' if is_unrestricted else ''}
+            Credits: {'UNLIMITED' if is_unrestricted else ctx['credits']}
             Access: {'UNRESTRICTED 🚀' if is_unrestricted else 'Standard'}
             Image Limit: {20 if is_unrestricted else 5} per request
-            Conversations: {len(user_info.get('conversations', []))}
+            Conversations: {len(ctx['user_info'].get('conversations', []))}
             
             Commands:
             • !premium - Premium features info
             • !help - Show all commands
             • !admin - Admin commands (admin only)
             """
-            
-            if user_id == ADMIN_USER_ID:
-                status_msg += f"""
+    
+    if ctx['user_id'] == ADMIN_USER_ID:
+        status_msg += f"""
                 
                 🛠️ ADMIN STATS:
-                Total Users: {len(USERS)}
-                Total Conversations: {len(CONVERSATIONS)}
-                Image Tasks: {len(IMAGE_GENERATION_TASKS)}
-                ClipFly Tokens: {len(load_clipfly_tokens())}
+                Total Users: {STATS['users']}
+                Total Conversations: {STATS['conversations']} ({STATS['cold_conversations']} compressed)
+                Image Tasks: {STATS['image_tasks']} ({STATS['active_image_tasks']} active)
+                ClipFly Tokens: {clipfly_token_count()}
                 """
-            
-            def generate():
-                words = status_msg.split(' ')
-                for i, word in enumerate(words):
-                    yield f"data: {json.dumps({'token': word + (' ' if i < len(words)-1 else '')})}\n\n"
-                    time.sleep(0.01)
-                yield "data: [DONE]\n\n"
-            
-            return Response(generate(), mimetype='text/event-stream')
+    return status_msg
+
+@chat_command('!unlock', admin_only=True, takes_args=True, help='Admin: make user premium')
+def unlock_command(ctx):
+    if not ctx['args']:
+        return "❌ Please specify a username. Example: !unlock username"
+    
+    target_user = ctx['args'][0]
+    for uid, user in USERS.items():
+        if user['username'] == target_user:
+            set_premium(uid, True)
+            return f"✅ Premium access unlocked for {target_user}"
+    return f"❌ User {target_user} not found"
+
+@app.route('/chat', methods=['POST'])
+@login_required
+@admission_control('chat')
+def chat():
+    try:
+        user_id = session['user_id']
+        username = session['username']
+        
+        # Get user info
+        user_info = USERS.get(user_id, {})
+        user_role = user_tier(user_id)
+        credits = user_info.get('credits', 0)
+        is_unrestricted = (user_id == ADMIN_USER_ID and ADMIN_UNLIMITED) or user_info.get('unrestricted', False)
+        if user_info:
+            user_info['last_active'] = now_ms()
+        
+        data = request.json
+        msg = data.get('message', '').strip()
+        conv_id = data.get('conversation_id')
+        
+        if not msg:
+            return jsonify({"error": "Empty message"}), 400
+        
+        command, args = match_chat_command(msg, user_id == ADMIN_USER_ID)
+        cost = command['cost'] if command else 1
+        
+        # Check and use credits for non-unrestricted users
+        charged = cost if not is_unrestricted else 0
+        if charged:
+            if not user_has_credits(user_id):
+                return jsonify({"error": "Insufficient credits"}), 403
+            for _ in range(cost):
+                if not use_credit(user_id):
+                    return jsonify({"error": "Failed to use credit"}), 500
+        
+        # Update conversation title if first message
+        conv = CONVERSATIONS.get(conv_id) if conv_id else None
+        if conv is not None and conv['user_id'] != user_id:
+            conv = None
+        if conv is not None and not conv['log']:
+            update_conversation_title(conv_id, msg)
         
-        def generate():
-            for chunk in ai.process_streaming(
-                msg,
-                data.get('mode', 'chat'),
-                data.get('history', []),
-                username,
-                user_role,
-                credits
-            ):
-                yield f"data: {chunk}\n"
+        # Send notification to Telegram
+        send_telegram_conversation(user_id, conv_id, msg)
+        
+        # Handle special commands
+        if command:
+            return run_chat_command(command, {
+                'user_id': user_id,
+                'username': username,
+                'user_info': user_info,
+                'user_role': user_role,
+                'credits': credits,
+                'is_unrestricted': is_unrestricted,
+                'args': args
+            })
         
-        return Response(generate(), mimetype='text/event-stream')
+        # The server's own log is the context; a client-sent history is only
+        # used for requests without a conversation
+        if conv is not None:
+            history = conversation_history(conv, CONTEXT_MESSAGES)
+            on_complete = lambda reply: append_turn(conv_id, msg, reply)
+        else:
+            history = data.get('history', [])
+            on_complete = None
+        # No upstream reply (busy, degraded, error): give the credit back
+        on_failure = (lambda: add_credits(user_id, charged)) if charged else None
+        
+        # The reply keeps running after a disconnect (it can be resumed), so
+        # it holds the chat slot until it is complete, not until the response closes
+        release_slot = hand_off_admission_slot()
+        stream = start_chat_stream(user_id, reply_events(ai.process_streaming(
+            msg,
+            data.get('mode', 'chat'),
+            history,
+            username,
+            user_role,
+            credits,
+            user_id=user_id
+        ), on_complete, on_failure), release_slot)
+        response = sse_response(stream.follow())
+        response.headers['X-Stream-Id'] = stream.id
+        return response
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/chat/resume', methods=['GET'])
+@login_required
+@admission_control('resume')
+def resume_chat():
+    """Resume a chat stream after the event named by Last-Event-ID"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    stream_id, seq = parse_last_event_id(last_event_id)
+    stream = CHAT_STREAMS.get(stream_id)
+    
+    if not stream or stream.user_id != session['user_id']:
+        return jsonify({"error": "Stream not found or expired"}), 404
+    
+    response = sse_response(stream.follow(after=seq))
+    response.headers['X-Stream-Id'] = stream.id
+    return response
+
 # Image Generation API endpoints
 @app.route('/api/generate-image', methods=['POST'])
 @login_required
+@admission_control('image')
 def api_generate_image():
     try:
         user_id = session['user_id']
@@ -5015,27 +7922,31 @@ def api_generate_image():
         task_id = str(uuid.uuid4())[:12]
         
         # Store task info
-        IMAGE_GENERATION_TASKS[task_id] = {
-            'user_id': user_id,
-            'username': username,
-            'prompt': prompt,
-            'model_id': model_id,
-            'image_count': image_count,
-            'status': 'processing',
-            'start_time': datetime.now().isoformat(),
-            'conversation_id': conv_id,
-            'progress': 0,
-            'token': tokens[0] if tokens else None,
-            'unrestricted': is_unrestricted
-        }
-        
-        # Start generation in background thread
+        IMAGE_GENERATION_TASKS[task_id] = ImageTask(
+            user_id=user_id,
+            username=username,
+            prompt=prompt,
+            model_id=model_id,
+            image_count=image_count,
+            status=TaskStatus.PROCESSING,
+            start_time=now_ms(),
+            conversation_id=conv_id,
+            progress=0,
+            token=tokens[0] if tokens else None,
+            unrestricted=is_unrestricted
+        )
+        bump_stat('image_tasks')
+        bump_stat('active_image_tasks')
+        
+        # Start generation in background thread; it holds the image job slot until done
+        release_slot = hand_off_admission_slot()
+        
         def generate_images():
             try:
                 print(f"Starting image generation for {'PREMIUM/ADMIN' if is_unrestricted else 'FREE'} user {username}")
                 
                 # Update task status
-                IMAGE_GENERATION_TASKS[task_id]['status'] = 'processing'
+                IMAGE_GENERATION_TASKS[task_id]['status'] = TaskStatus.PROCESSING
                 IMAGE_GENERATION_TASKS[task_id]['progress'] = 10
                 
                 # Generate image with multiple attempts for premium
@@ -5088,7 +7999,7 @@ def api_generate_image():
                                 if status == 2:  # Completed
                                     image_url = extract_image_url(task)
                                     if image_url:
-                                        IMAGE_GENERATION_TASKS[task_id]['status'] = 'completed'
+                                        IMAGE_GENERATION_TASKS[task_id]['status'] = TaskStatus.COMPLETED
                                         IMAGE_GENERATION_TASKS[task_id]['progress'] = 100
                                         IMAGE_GENERATION_TASKS[task_id]['image_url'] = image_url
                                         
@@ -5102,7 +8013,7 @@ def api_generate_image():
                                         break
                                 elif status == 3:  # Failed
                                     error = task.get("error_msg", "Unknown error")
-                                    IMAGE_GENERATION_TASKS[task_id]['status'] = 'failed'
+                                    IMAGE_GENERATION_TASKS[task_id]['status'] = TaskStatus.FAILED
                                     IMAGE_GENERATION_TASKS[task_id]['error'] = error
                                     break
                         
@@ -5114,19 +8025,22 @@ def api_generate_image():
                         time.sleep(CHECK_INTERVAL)
                     
                     if not image_url:
-                        IMAGE_GENERATION_TASKS[task_id]['status'] = 'failed'
+                        IMAGE_GENERATION_TASKS[task_id]['status'] = TaskStatus.FAILED
                         IMAGE_GENERATION_TASKS[task_id]['error'] = 'Generation timeout'
                     
                 else:
                     error = result.get("error", "Unknown error") if result else "Unknown error"
-                    IMAGE_GENERATION_TASKS[task_id]['status'] = 'failed'
+                    IMAGE_GENERATION_TASKS[task_id]['status'] = TaskStatus.FAILED
                     IMAGE_GENERATION_TASKS[task_id]['error'] = error
                     print(f"Image generation failed: {error}")
                     
             except Exception as e:
                 print(f"Error in image generation thread: {e}")
-                IMAGE_GENERATION_TASKS[task_id]['status'] = 'failed'
+                IMAGE_GENERATION_TASKS[task_id]['status'] = TaskStatus.FAILED
                 IMAGE_GENERATION_TASKS[task_id]['error'] = str(e)
+            finally:
+                bump_stat('active_image_tasks', -1)
+                release_slot()
         
         # Start background thread
         thread = threading.Thread(target=generate_images)
@@ -5169,7 +8083,7 @@ def api_image_status(task_id):
             "progress": task.get('progress', 0)
         }
         
-        if task['status'] == 'completed':
+        if task['status'] == TaskStatus.COMPLETED:
             response['image_url'] = task.get('image_url')
             # Get model name
             model_name = task['model_id']
@@ -5179,7 +8093,7 @@ def api_image_status(task_id):
                     break
             response['model_name'] = model_name
             
-        elif task['status'] == 'failed':
+        elif task['status'] == TaskStatus.FAILED:
             response['error'] = task.get('error', 'Unknown error')
         
         return jsonify(response)
@@ -5227,6 +8141,7 @@ def api_save_user_preferences():
         
         if 'model' in data:
             USER_IMAGE_MODELS[user_id] = data['model']
+            journal('pref', user_id, 'model', data['model'])
         
         if 'image_count' in data:
             count = int(data['image_count'])
@@ -5236,78 +8151,169 @@ def api_save_user_preferences():
             max_count = 20 if is_unrestricted else 5
             if 1 <= count <= max_count:
                 USER_IMAGE_COUNTS[user_id] = count
+                journal('pref', user_id, 'image_count', count)
         
         return jsonify({"success": True})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 # User API endpoints
+def get_credit_state(user_id):
+    """Credit view for a user, or None if the user is unknown"""
+    # Admin has unlimited
+    if user_id == ADMIN_USER_ID and ADMIN_UNLIMITED:
+        return {"has_credits": True, "credits": 999999, "unlimited": True, "unrestricted": True, "is_admin": True}
+    
+    user_info = USERS.get(user_id)
+    if user_info is None:
+        return None
+    
+    credits = user_info.get('credits', 0)
+    # Premium users have unlimited access
+    if user_info.get('unrestricted'):
+        return {"has_credits": True, "credits": credits, "unrestricted": True}
+    return {"has_credits": credits > 0, "credits": credits}
+
+@app.route('/api/credits', methods=['GET'])
 @app.route('/api/check-credits', methods=['GET'])
+@app.route('/api/get-credits', methods=['GET'])
 @login_required
-def check_credits():
+def credits_view():
+    """Credit state for the session user; 304 if the client's copy is current"""
     try:
         user_id = session.get('user_id')
-        
         if not user_id:
-            return jsonify({"has_credits": False, "error": "No user session"})
+            return jsonify({"success": False, "has_credits": False, "error": "No user session"})
         
-        # Admin has infinite credits
-        if user_id == ADMIN_USER_ID and ADMIN_UNLIMITED:
-            return jsonify({"has_credits": True, "is_admin": True, "unrestricted": True})
-        
-        # Premium users have unlimited access
-        user_info = USERS.get(user_id, {})
-        if user_info.get('unrestricted'):
-            return jsonify({"has_credits": True, "unrestricted": True})
-        
-        if user_id in USERS:
-            credits = USERS[user_id].get('credits', 0)
-            has_credits = credits > 0
-            return jsonify({"has_credits": has_credits, "credits": credits})
+        etag = credit_etag(user_id)
+        if etag in request.headers.get('If-None-Match', ''):
+            response = Response(status=304)
         else:
-            return jsonify({"has_credits": False, "error": "User not found"})
-            
+            credit_state = get_credit_state(user_id)
+            if credit_state is None:
+                return jsonify({"success": False, "has_credits": False, "error": "User not found"})
+            response = jsonify({"success": True, **credit_state})
+        
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
     except Exception as e:
-        return jsonify({"has_credits": False, "error": str(e)})
+        return jsonify({"success": False, "has_credits": False, "error": str(e)})
 
-@app.route('/api/get-credits', methods=['GET'])
+CONVERSATION_PAGE_SIZE = 50
+MAX_CONVERSATION_PAGE_SIZE = 200
+
+def conversation_summary(conv):
+    """Sidebar fields of a conversation, without its messages"""
+    return {
+        'id': conv['id'],
+        'title': conv.get('title', 'New Chat'),
+        'created_at': iso_from_ms(conv['created_at']),
+        'updated_at': iso_from_ms(conv['updated_at']),
+        'message_count': conv['message_count']
+    }
+
+def conversation_summary_page(user_id, offset=0, limit=CONVERSATION_PAGE_SIZE):
+    """One page of a user's conversation summaries, most recently updated first"""
+    conv_ids = USERS.get(user_id, {}).get('conversations', [])
+    convs = [CONVERSATIONS[conv_id] for conv_id in conv_ids if conv_id in CONVERSATIONS]
+    convs.sort(key=lambda conv: conv['updated_at'], reverse=True)
+    
+    offset = max(0, offset)
+    limit = max(1, min(limit, MAX_CONVERSATION_PAGE_SIZE))
+    page = convs[offset:offset + limit]
+    has_more = offset + len(page) < len(convs)
+    return {
+        'items': [conversation_summary(conv) for conv in page],
+        'total': len(convs),
+        'has_more': has_more,
+        'next_offset': offset + len(page) if has_more else None
+    }
+
+def page_args():
+    """offset/limit query parameters, falling back to the first page"""
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args.get('limit', CONVERSATION_PAGE_SIZE))
+    except ValueError:
+        offset, limit = 0, CONVERSATION_PAGE_SIZE
+    return offset, limit
+
+@app.route('/api/bootstrap', methods=['GET'])
 @login_required
-def get_credits():
+def api_bootstrap():
+    """Everything the chat UI needs at startup, in one response"""
     try:
-        user_id = session.get('user_id')
-        if not user_id:
-            return jsonify({"success": False, "error": "No user session"})
-        
-        # Admin has unlimited
-        if user_id == ADMIN_USER_ID and ADMIN_UNLIMITED:
-            return jsonify({"success": True, "credits": 999999, "unlimited": True})
+        user_id = session['user_id']
+        credit_state = get_credit_state(user_id)
+        if credit_state is None:
+            return jsonify({"success": False, "error": "User not found"}), 404
         
-        # Premium users
         user_info = USERS.get(user_id, {})
-        if user_info.get('unrestricted'):
-            return jsonify({"success": True, "credits": user_info.get('credits', 0), "unrestricted": True})
+        is_admin = user_id == ADMIN_USER_ID
+        is_premium = user_info.get('is_premium', False)
+        is_unrestricted = is_admin and ADMIN_UNLIMITED or is_premium
+        offset, limit = page_args()
         
-        if user_id in USERS:
-            credits = USERS[user_id].get('credits', 0)
-            return jsonify({"success": True, "credits": credits})
-        else:
-            return jsonify({"success": False, "error": "User not found"})
+        data = {
+            "success": True,
+            "user": {
+                "id": user_id,
+                "username": session.get('username'),
+                "role": 'admin' if is_admin else 'premium' if is_premium else 'free',
+                "is_admin": is_admin,
+                "is_unrestricted": is_unrestricted,
+                "max_image_count": 20 if is_unrestricted else 5
+            },
+            "credits": credit_state,
+            "credits_etag": credit_etag(user_id),
+            "preferences": {
+                'model': USER_IMAGE_MODELS.get(user_id, DEFAULT_MODEL),
+                'image_count': USER_IMAGE_COUNTS.get(user_id, 1)
+            },
+            "models": AVAILABLE_MODELS,
+            "conversations": conversation_summary_page(user_id, offset, limit)
+        }
+        if is_admin:
+            data["token_count"] = clipfly_token_count()
+        
+        response = jsonify(data)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.add_etag()
+        return response.make_conditional(request)
     except Exception as e:
-        return jsonify({"success": False, "error": str(e)})
+        return jsonify({"success": False, "error": str(e)}), 500
 
 # Conversation API endpoints
 @app.route('/api/conversations', methods=['GET'])
 @login_required
 def get_conversations():
     user_id = session['user_id']
+    
+    if request.args.get('view') == 'summary':
+        offset, limit = page_args()
+        return jsonify({"success": True, "conversations": conversation_summary_page(user_id, offset, limit)})
+    
     user_conversations = {}
     
-    for conv_id, conv in CONVERSATIONS.items():
-        if conv['user_id'] == user_id:
-            user_conversations[conv_id] = conv
+    for conv_id in USERS.get(user_id, {}).get('conversations', []):
+        conv = CONVERSATIONS.get(conv_id)
+        if conv is not None:
+            user_conversations[conv_id] = conversation_view(conv)
     
     return jsonify({"success": True, "conversations": user_conversations})
 
+@app.route('/api/conversations/search', methods=['GET'])
+@login_required
+def search_conversations_api():
+    query = request.args.get('q', '').strip()
+    try:
+        limit = int(request.args.get('limit', SEARCH_RESULTS))
+    except ValueError:
+        limit = SEARCH_RESULTS
+    limit = max(1, min(limit, MAX_CONVERSATION_PAGE_SIZE))
+    return jsonify(dict(search_conversations(session['user_id'], query, limit), success=True))
+
 @app.route('/api/conversation/new', methods=['POST'])
 @login_required
 def new_conversation():
@@ -5319,16 +8325,57 @@ def new_conversation():
 @login_required
 def get_conversation(conv_id):
     if conv_id in CONVERSATIONS and CONVERSATIONS[conv_id]['user_id'] == session['user_id']:
-        return jsonify({"success": True, "conversation": CONVERSATIONS[conv_id]})
+        return jsonify({"success": True, "conversation": conversation_view(CONVERSATIONS[conv_id])})
     return jsonify({"success": False, "error": "Conversation not found"})
 
+MESSAGE_PAGE_SIZE = 50
+MAX_MESSAGE_PAGE_SIZE = 200
+
+def message_page(conv, before=None, limit=MESSAGE_PAGE_SIZE):
+    """Up to `limit` messages ending before position `before`; the newest page by default.
+    
+    Positions only change when the log is replaced or cleared, so `start` of
+    one page is a stable `before` cursor for the next older one.
+    """
+    total = conv['message_count']
+    before = total if before is None else max(0, min(before, total))
+    limit = max(1, min(limit, MAX_MESSAGE_PAGE_SIZE))
+    start = max(0, before - limit)
+    return {
+        'messages': conversation_messages(conv, start, before),
+        'start': start,
+        'total': total,
+        'has_more': start > 0
+    }
+
+@app.route('/api/conversation/<conv_id>/messages', methods=['GET'])
+@login_required
+def get_conversation_messages(conv_id):
+    conv = CONVERSATIONS.get(conv_id)
+    if conv is None or conv['user_id'] != session['user_id']:
+        return jsonify({"success": False, "error": "Conversation not found"})
+    try:
+        before = request.args.get('before')
+        before = int(before) if before is not None else None
+        limit = int(request.args.get('limit', MESSAGE_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"success": False, "error": "before and limit must be integers"}), 400
+    page = message_page(conv, before, limit)
+    page['conversation'] = conversation_summary(conv)
+    return jsonify(dict(page, success=True))
+
 @app.route('/api/conversation/<conv_id>/save', methods=['POST'])
 @login_required
 def save_conversation(conv_id):
-    data = request.json
+    """Replace a conversation's title and/or messages. Chat turns are recorded
+    by /chat itself; this is for edits and imports."""
+    data = request.json or {}
     if conv_id in CONVERSATIONS and CONVERSATIONS[conv_id]['user_id'] == session['user_id']:
-        CONVERSATIONS[conv_id].update(data)
-        CONVERSATIONS[conv_id]['updated_at'] = datetime.now().isoformat()
+        conv = CONVERSATIONS[conv_id]
+        if 'title' in data:
+            set_conversation_title(conv, str(data['title'])[:100])
+        if 'messages' in data:
+            replace_log(conv, log_from_messages(data['messages']))
         return jsonify({"success": True})
     return jsonify({"success": False, "error": "Conversation not found"})
 
@@ -5336,9 +8383,7 @@ def save_conversation(conv_id):
 @login_required
 def clear_conversation(conv_id):
     if conv_id in CONVERSATIONS and CONVERSATIONS[conv_id]['user_id'] == session['user_id']:
-        CONVERSATIONS[conv_id]['messages'] = []
-        CONVERSATIONS[conv_id]['history'] = []
-        CONVERSATIONS[conv_id]['updated_at'] = datetime.now().isoformat()
+        replace_log(CONVERSATIONS[conv_id], [])
         return jsonify({"success": True})
     return jsonify({"success": False, "error": "Conversation not found"})
 
@@ -5346,16 +8391,190 @@ def clear_conversation(conv_id):
 @login_required
 def delete_conversation(conv_id):
     if conv_id in CONVERSATIONS and CONVERSATIONS[conv_id]['user_id'] == session['user_id']:
-        # Remove from user's conversations list
-        user_id = CONVERSATIONS[conv_id]['user_id']
-        if user_id in USERS and conv_id in USERS[user_id]['conversations']:
-            USERS[user_id]['conversations'].remove(conv_id)
-        
-        # Delete conversation
-        del CONVERSATIONS[conv_id]
+        with _mutation_lock:
+            forget_conversation(conv_id)
+            journal('conv_del', conv_id)
         return jsonify({"success": True})
     return jsonify({"success": False, "error": "Conversation not found"})
 
+# Export and import
+# Conversations travel as NDJSON, one conversation per line in the shape
+# GET /api/conversation/<id> returns. Exports are generated one line at a time
+# from the store; imports are read line by line from the request body and
+# inserted in batches, so neither holds more than a batch in memory. An import
+# never evicts: it stops once the user has MAX_USER_CONVERSATIONS or the store
+# holds MAX_CONVERSATIONS.
+IMPORT_BATCH_SIZE = 500
+IMPORT_MAX_LINE_BYTES = 16 * 1024 * 1024  # Longer lines are skipped, not buffered
+IMPORT_MAX_ERRORS = 20  # Errors reported in detail; the rest are only counted
+MAX_USER_CONVERSATIONS = int(os.environ.get('MAX_USER_CONVERSATIONS', 1000))
+USER_IMPORT_MAX_BYTES = int(os.environ.get('USER_IMPORT_MAX_BYTES', 64 * 1024 * 1024))
+ADMIN_IMPORT_MAX_BYTES = int(os.environ.get('ADMIN_IMPORT_MAX_BYTES', 4 * 1024 * 1024 * 1024))
+
+def conversation_export_line(conv):
+    """One NDJSON line for a conversation, read without warming a cold log"""
+    view = conv.to_dict()
+    view['messages'] = [{'role': DISPLAY_ROLES[role], 'content': content} for role, content in conv.peek_log()]
+    return json_bytes(view) + b"\n"
+
+def export_conversations(conv_ids):
+    for conv_id in conv_ids:
+        conv = CONVERSATIONS.get(conv_id)
+        if conv is not None:  # Deleted since the export started
+            yield conversation_export_line(conv)
+
+def ndjson_download(body, filename):
+    return Response(body, mimetype='application/x-ndjson', headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'X-Accel-Buffering': 'no'
+    })
+
+def ndjson_lines(stream):
+    """Lines of an NDJSON stream; a line over IMPORT_MAX_LINE_BYTES is drained and yielded as None"""
+    while True:
+        line = stream.readline(IMPORT_MAX_LINE_BYTES)
+        if not line:
+            return
+        if len(line) == IMPORT_MAX_LINE_BYTES and not line.endswith(b"\n"):
+            while line and not line.endswith(b"\n"):
+                line = stream.readline(IMPORT_MAX_LINE_BYTES)
+            yield None
+        else:
+            yield line
+
+def imported_conversation(data, user_id):
+    """A new ConversationRecord from one export line; raises ValueError if malformed"""
+    if not isinstance(data, dict) or not isinstance(data.get('messages', []), list):
+        raise ValueError("expected an object with a messages list")
+    created_at = ms_from_iso(data.get('created_at'), now_ms())
+    return ConversationRecord(
+        id=generate_conversation_id(),  # Never overwrite: importing twice makes copies
+        user_id=user_id,
+        created_at=created_at,
+        updated_at=ms_from_iso(data.get('updated_at'), created_at),
+        title=str(data.get('title') or 'Imported Chat')[:100],
+        log=log_from_messages(data.get('messages', []))
+    )
+
+def insert_conversations(batch):
+    """Register and journal a batch of conversations under one lock.
+    
+    Returns (inserted, last commit, reason the import must stop or None).
+    """
+    inserted = 0
+    committed = None
+    with _mutation_lock:
+        for conv in batch:
+            if len(CONVERSATIONS) >= MAX_CONVERSATIONS:
+                return inserted, committed, "conversation store is full"
+            if len(USERS[conv.user_id].get('conversations', [])) >= MAX_USER_CONVERSATIONS:
+                return inserted, committed, f"user {conv.user_id} has reached {MAX_USER_CONVERSATIONS} conversations"
+            register_conversation(conv)
+            committed = journal('import', conv.id, conv.user_id, conv.created_at, conv.updated_at, conv.title,
+                                [[role.value, content] for role, content in conv.log])
+            inserted += 1
+    return inserted, committed, None
+
+def import_conversations(stream, owner):
+    """Insert the conversations of an NDJSON stream in batches.
+    
+    owner(data) returns the user id a line belongs to, or None to skip it.
+    The import stops early (result['stopped'] says why) at a conversation
+    limit or when a CappedReader body goes over its cap; the
+    lines before that point stay imported.
+    """
+    result = {'imported': 0, 'skipped': 0, 'errors': [], 'stopped': None}
+    batch = []
+    committed = None
+    
+    def flush():
+        nonlocal committed
+        inserted, last, stopped = insert_conversations(batch)
+        committed = last or committed
+        result['imported'] += inserted
+        result['stopped'] = result['stopped'] or stopped
+        batch.clear()
+    
+    try:
+        for number, line in enumerate(ndjson_lines(stream), 1):
+            try:
+                if line is None:
+                    raise ValueError(f"line longer than {IMPORT_MAX_LINE_BYTES} bytes")
+                if not line.strip():
+                    continue
+                data = json_loads(line)
+                user_id = owner(data)
+                if user_id is None:
+                    raise ValueError("unknown user")
+                batch.append(imported_conversation(data, user_id))
+            except (ValueError, TypeError) as e:
+                result['skipped'] += 1
+                if len(result['errors']) < IMPORT_MAX_ERRORS:
+                    result['errors'].append({'line': number, 'error': str(e)})
+                continue
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                flush()
+                if result['stopped']:
+                    break
+    except RequestEntityTooLarge:
+        result['stopped'] = "request body is too large"
+    if batch:
+        flush()
+    wait_durable(committed)
+    return result
+
+@app.route('/api/conversations/export', methods=['GET'])
+@login_required
+def export_user_conversations():
+    user_id = session['user_id']
+    conv_ids = list(USERS.get(user_id, {}).get('conversations', []))
+    return ndjson_download(export_conversations(conv_ids), 'conversations.ndjson')
+
+class CappedReader(io.RawIOBase):
+    """Raw reader over a request body that raises RequestEntityTooLarge past max_bytes"""
+    
+    def __init__(self, stream, max_bytes):
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.consumed = 0
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, buffer):
+        if self.consumed > self.max_bytes:
+            raise RequestEntityTooLarge()
+        # Ask for one byte past the cap so an oversized body is noticed; the
+        # bytes up to the cap are still delivered, the next read raises
+        data = self.stream.read(min(len(buffer), self.max_bytes - self.consumed + 1))
+        self.consumed += len(data)
+        if self.consumed > self.max_bytes:
+            data = data[:-1]
+            if not data:
+                raise RequestEntityTooLarge()
+        buffer[:len(data)] = data
+        return len(data)
+
+def import_body(max_bytes):
+    """(request body capped at max_bytes, None), or (None, 413 response) if Content-Length is already over it.
+    
+    A chunked body is cut off at the cap while it is read (see import_conversations).
+    """
+    if (request.content_length or 0) > max_bytes:
+        return None, (jsonify({"success": False, "error": f"Import is larger than {max_bytes} bytes"}), 413)
+    return io.BufferedReader(CappedReader(request.stream, max_bytes)), None
+
+@app.route('/api/conversations/import', methods=['POST'])
+@login_required
+@admission_control('import')
+def import_user_conversations():
+    user_id = session['user_id']
+    body, too_large = import_body(USER_IMPORT_MAX_BYTES)
+    if too_large:
+        return too_large
+    result = import_conversations(body, lambda data: user_id)
+    return jsonify(dict(result, success=True))
+
 # Admin API endpoints
 @app.route('/admin/verify', methods=['POST'])
 @login_required
@@ -5380,6 +8599,7 @@ def save_admin_settings():
         BOT_SETTINGS['avatar_type'] = data.get('avatar_type', BOT_SETTINGS['avatar_type'])
         BOT_SETTINGS['avatar_url'] = data.get('avatar_url', BOT_SETTINGS['avatar_url'])
         BOT_SETTINGS['tagline'] = data.get('tagline', BOT_SETTINGS['tagline'])
+        journal('settings', BOT_SETTINGS)
         
         return jsonify({"success": True})
     except Exception as e:
@@ -5389,22 +8609,70 @@ def save_admin_settings():
 @login_required
 @admin_required
 def get_users():
-    users_list = []
-    for user_id, user in USERS.items():
-        if user_id != ADMIN_USER_ID:  # Exclude admin from list
-            users_list.append({
-                'id': user_id,
-                'username': user['username'],
-                'credits': user['credits'],
-                'is_premium': user.get('is_premium', False),
-                'created_at': user['created_at'],
-                'conversation_count': len(user.get('conversations', []))
-            })
+    """Paged user listing. Query: q (username prefix or user id), filter
+    (premium, low_credits, inactive; comma separated), cursor, limit"""
+    try:
+        filters = set(filter(None, request.args.get('filter', '').split(',')))
+        try:
+            limit = int(request.args.get('limit', ADMIN_USERS_PAGE_SIZE))
+        except ValueError:
+            limit = ADMIN_USERS_PAGE_SIZE
+        
+        result = query_users(
+            search=request.args.get('q', '').strip(),
+            premium='premium' in filters,
+            low_credits='low_credits' in filters,
+            inactive='inactive' in filters,
+            after=request.args.get('cursor') or None,
+            limit=max(1, min(limit, MAX_ADMIN_USERS_PAGE_SIZE))
+        )
+        return jsonify({
+            "success": True,
+            "users": result['users'],
+            "next_cursor": result['next_cursor'],
+            "total": STATS['users'] - (ADMIN_USER_ID in USERS)  # Exclude admin
+        })
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
+@app.route('/admin/export', methods=['GET'])
+@login_required
+@admin_required
+def admin_export_conversations():
+    """Every conversation (or one user's, with ?user_id=) as NDJSON"""
+    user_id = request.args.get('user_id')
+    if user_id:
+        conv_ids = list(USERS.get(user_id, {}).get('conversations', []))
+    else:
+        conv_ids = list(CONVERSATIONS)
+    return ndjson_download(export_conversations(conv_ids), f"conversations-{user_id or 'all'}.ndjson")
+
+@app.route('/admin/import', methods=['POST'])
+@login_required
+@admin_required
+@admission_control('import')
+def admin_import_conversations():
+    """Import NDJSON conversations for ?user_id=, or for the user_id on each line"""
+    target = request.args.get('user_id')
+    if target and target not in USERS:
+        return jsonify({"success": False, "error": "User not found"})
     
-    # Sort by creation date (newest first)
-    users_list.sort(key=lambda x: x['created_at'], reverse=True)
+    def owner(data):
+        user_id = target or (data.get('user_id') if isinstance(data, dict) else None)
+        return user_id if isinstance(user_id, str) and user_id in USERS else None
     
-    return jsonify({"success": True, "users": users_list})
+    body, too_large = import_body(ADMIN_IMPORT_MAX_BYTES)
+    if too_large:
+        return too_large
+    result = import_conversations(body, owner)
+    return jsonify(dict(result, success=True))
+
+@app.route('/admin/upstream-cache/clear', methods=['POST'])
+@login_required
+@admin_required
+def clear_upstream_cache():
+    upstream_cache.clear()
+    return jsonify({"success": True})
 
 @app.route('/admin/add-credits', methods=['POST'])
 @login_required
@@ -5451,9 +8719,7 @@ def make_premium():
             return jsonify({"success": False, "error": "User not found"})
         
         # Make premium
-        USERS[user_found]['is_premium'] = True
-        USERS[user_found]['unrestricted'] = True
-        USERS[user_found]['credits'] = PREMIUM_CREDITS
+        set_premium(user_found, True)
         
         return jsonify({
             "success": True,
@@ -5488,10 +8754,8 @@ def remove_premium():
         if user_found == ADMIN_USER_ID:
             return jsonify({"success": False, "error": "Cannot remove premium from admin"})
         
-        # Remove premium
-        USERS[user_found]['is_premium'] = False
-        USERS[user_found]['unrestricted'] = False
-        # Keep existing credits
+        # Remove premium, keeping existing credits
+        set_premium(user_found, False)
         
         return jsonify({
             "success": True,
@@ -5508,15 +8772,15 @@ def get_premium_users():
     """Get list of premium users"""
     try:
         premium_users = []
-        for user_id, user in USERS.items():
-            if user.get('is_premium'):
-                premium_users.append({
-                    'id': user_id,
-                    'username': user['username'],
-                    'credits': user['credits'],
-                    'created_at': user['created_at'],
-                    'conversations': len(user.get('conversations', []))
-                })
+        for user_id in USER_INDEX.premium_newest_first():
+            user = USERS[user_id]
+            premium_users.append({
+                'id': user_id,
+                'username': user['username'],
+                'credits': user['credits'],
+                'created_at': iso_from_ms(user['created_at']),
+                'conversations': len(user.get('conversations', []))
+            })
         
         return jsonify({
             "success": True,
@@ -5564,9 +8828,7 @@ def admin_add_tokens():
                 added_count += 1
         
         # Save tokens
-        with open(CLIPFLY_TOKEN_FILE, "w") as f:
-            for token in existing_tokens:
-                f.write(f"{token}\n")
+        save_clipfly_tokens(existing_tokens)
         
         return jsonify({
             "success": True,
@@ -5582,7 +8844,8 @@ def admin_add_tokens():
 def debug():
     user_id = session.get('user_id')
     username = session.get('username')
-    user_data = USERS.get(user_id, {})
+    user = USERS.get(user_id)
+    user_data = user.to_dict() if user else {}
     
     return jsonify({
         "user_id": user_id,
@@ -5598,32 +8861,56 @@ def debug():
 
 @app.route('/health')
 def health():
-    premium_count = len([u for u in USERS.values() if u.get('is_premium')])
     return jsonify({
         "status": "ok", 
-        "users": len(USERS), 
-        "premium_users": premium_count,
-        "conversations": len(CONVERSATIONS),
-        "image_tasks": len(IMAGE_GENERATION_TASKS),
+        "users": STATS['users'], 
+        "premium_users": STATS['premium_users'],
+        "conversations": STATS['conversations'],
+        "conversation_tiers": conversation_tiers(),
+        "image_tasks": STATS['image_tasks'],
+        "active_image_tasks": STATS['active_image_tasks'],
         "bot_name": BOT_SETTINGS['name'],
-        "clipfly_tokens": len(load_clipfly_tokens()),
+        "clipfly_tokens": clipfly_token_count(),
         "admin_unlimited": ADMIN_UNLIMITED,
+        "cold_start": dict(COLD_START, **IMPORT_PROFILE),
+        "upstream": upstream_breaker.snapshot(),
+        "upstream_cache": upstream_cache.snapshot(),
+        "upstream_coalescing": upstream_flights.snapshot(),
+        "upstream_scheduler": upstream_scheduler.snapshot(),
+        "persistence": JOURNAL.status() if JOURNAL is not None else None,
         "version": "Unrestricted Edition"
     })
 
+_app_started = False
+
+def create_app():
+    """Start the serving process: restore durable state from DATA_DIR and begin journaling.
+    
+    Run it once per process before serving (gunicorn -w 1 'chat:create_app()');
+    importing the module alone touches no files. Only one process may own
+    DATA_DIR, so serve it with a single worker. If the server loads `app`
+    directly, the first request calls this instead.
+    """
+    global _app_started
+    with _init_lock:
+        if not _app_started:
+            if DATA_DIR:
+                restore_state()
+            _app_started = True
+    return app
+
+if not LAZY_INIT:
+    warm_up()
+
+IMPORT_PROFILE['module_ms'] = round((time.perf_counter() - _IMPORT_STARTED) * 1000, 2)
+if IMPORT_PROFILE['module_ms'] > COLD_START_BUDGET_MS:
+    logger.warning(f"Import took {IMPORT_PROFILE['module_ms']}ms, over the {COLD_START_BUDGET_MS}ms cold start budget")
+
 if __name__ == '__main__':
+    create_app()
+    
     # Initialize admin user
-    if ADMIN_USER_ID not in USERS:
-        USERS[ADMIN_USER_ID] = {
-            'id': ADMIN_USER_ID,
-            'username': 'admin',
-            'password': hash_password(ADMIN_PASSWORD),
-            'credits': 999999,
-            'is_premium': True,
-            'unrestricted': True,
-            'created_at': datetime.now().isoformat(),
-            'conversations': []
-        }
+    ensure_admin_user()
     
     # Ensure image directory exists
     ensure_image_directory()
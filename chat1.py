@@ -1369,17 +1369,15 @@ def home():
         fb_source=fb_source
     )
 
-@app.route('/chat', methods=['POST'])
-def chat():
-    try:
-        data = request.json
-        msg = data.get('message', '').strip()
-        
-        if not msg:
-            return jsonify({"error": "Empty message"})
-        
-        if msg.lower() == 'help':
-            help_text = f"""{BOT_SETTINGS['name']} - Help
+# Help reply, pre-encoded as a complete SSE body; only changes with the bot name
+HELP_REPLY_CACHE = {}
+
+def get_help_reply():
+    """Return the help reply as one SSE token event followed by [DONE]"""
+    name = BOT_SETTINGS['name']
+    body = HELP_REPLY_CACHE.get(name)
+    if body is None:
+        help_text = f"""{name} - Help
 
 Chat Mode: General conversation and assistance
 Code Mode: Programming and development focus
@@ -1399,15 +1397,21 @@ Features:
 • Code generation and debugging
 
 Created by JHONWILSON"""
-            
-            def generate():
-                words = help_text.split(' ')
-                for i, word in enumerate(words):
-                    yield f"data: {json.dumps({'token': word + (' ' if i < len(words)-1 else '')})}\n\n"
-                    time.sleep(0.02)
-                yield "data: [DONE]\n\n"
-            
-            return Response(generate(), mimetype='text/event-stream')
+        HELP_REPLY_CACHE.clear()  # bot name changed via /admin/save
+        body = HELP_REPLY_CACHE[name] = f"data: {json.dumps({'token': help_text})}\n\ndata: [DONE]\n\n".encode('utf-8')
+    return body
+
+@app.route('/chat', methods=['POST'])
+def chat():
+    try:
+        data = request.json
+        msg = data.get('message', '').strip()
+        
+        if not msg:
+            return jsonify({"error": "Empty message"})
+        
+        if msg.lower() == 'help':
+            return Response(get_help_reply(), mimetype='text/event-stream')
         
         def generate():
             for chunk in ai.process_streaming(